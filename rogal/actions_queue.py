@@ -0,0 +1,134 @@
+import heapq
+import itertools
+import logging
+
+from . import components
+
+
+log = logging.getLogger(__name__)
+
+
+class ActionsQueue:
+
+    """Priority queue of actors ordered by tick at which they will take their next action.
+
+    Fed with WaitsForAction changes: inserting WaitsForAction(wait_time) schedules actor
+    to act after wait_time ticks (at least one), removing it unschedules actor.
+
+    Instead of decreasing wait times of all actors tick by tick, clock jumps straight
+    to the next tick at which anyone acts. Actors whose turn came, but were not rescheduled
+    yet (by inserting new WaitsForAction), are acting on each consecutive tick.
+
+    Dormant actors can be suspended - removed from the schedule, keeping ticks left to
+    their action. When resumed all ticks that passed in the meantime are skipped.
+
+    """
+
+    def __init__(self, ecs):
+        self.ecs = ecs
+        self.waits_for_action = self.ecs.manage(components.WaitsForAction)
+        self.changes = self.waits_for_action.track_changes()
+
+        # Current tick
+        self.tick = 0
+        # Heap of (tick, seq, entity), outdated entries are skipped when popped
+        self._heap = []
+        self._seq = itertools.count()
+        # entity -> (tick, seq) of valid entry in heap
+        self._scheduled = {}
+        # Actors whose turn came, waiting to be rescheduled
+        self._overdue = set()
+        # Suspended actors: entity -> ticks left to their action
+        self._suspended = {}
+
+        for entity, wait_time in self.waits_for_action:
+            self.schedule(entity, int(wait_time))
+
+    def schedule(self, entity, wait_time):
+        """Schedule entity to act after given number of ticks."""
+        tick = self.tick + max(wait_time, 1)
+        seq = next(self._seq)
+        self._scheduled[entity] = (tick, seq)
+        heapq.heappush(self._heap, (tick, seq, entity))
+        self._overdue.discard(entity)
+
+    def unschedule(self, entity):
+        self._scheduled.pop(entity, None)
+        self._overdue.discard(entity)
+        self._suspended.pop(entity, None)
+
+    def suspend(self, entity):
+        """Remove entity from schedule until resumed."""
+        scheduled = self._scheduled.pop(entity, None)
+        if scheduled:
+            self._suspended[entity] = scheduled[0] - self.tick
+        elif entity in self._overdue:
+            self._overdue.discard(entity)
+            self._suspended[entity] = 0
+
+    def resume(self, entity):
+        """Schedule suspended entity again, skipping ticks that passed since it was suspended."""
+        ticks_left = self._suspended.pop(entity, None)
+        if ticks_left is not None:
+            self.schedule(entity, ticks_left)
+
+    def is_suspended(self, entity):
+        return entity in self._suspended
+
+    def update(self):
+        """Apply changes made to WaitsForAction since last update."""
+        changes = self.changes.read()
+        if not changes:
+            return
+        for entity in changes.removed:
+            self.unschedule(entity)
+        for entity in changes.changed:
+            wait_time = int(self.waits_for_action.get(entity))
+            if entity in self._suspended:
+                self._suspended[entity] = wait_time
+            else:
+                self.schedule(entity, wait_time)
+
+    def _pop_outdated(self):
+        while self._heap:
+            tick, seq, entity = self._heap[0]
+            if self._scheduled.get(entity) == (tick, seq):
+                return
+            heapq.heappop(self._heap)
+
+    def next_tick(self):
+        """Return tick at which next actor acts, or None if no one is scheduled."""
+        if self._overdue:
+            return self.tick + 1
+        self._pop_outdated()
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
+    def pop_acting(self):
+        """Advance to next tick when anyone acts, return actors acting at this tick."""
+        self.update()
+        next_tick = self.next_tick()
+        if next_tick is None:
+            return set()
+        self.tick = next_tick
+
+        while self._heap and self._heap[0][0] <= self.tick:
+            tick, seq, entity = heapq.heappop(self._heap)
+            if self._scheduled.get(entity) == (tick, seq):
+                del self._scheduled[entity]
+                self._overdue.add(entity)
+
+        return set(self._overdue)
+
+    @property
+    def suspended(self):
+        return self._suspended.keys()
+
+    def __contains__(self, entity):
+        """Return True if entity is actively scheduled (not suspended)."""
+        return entity in self._scheduled or entity in self._overdue
+
+    def __len__(self):
+        return len(self._scheduled) + len(self._overdue)
+
@@ -198,16 +198,16 @@ class AI(TakeActionHandler):
 
     def is_seen_by_player(self, actor):
         # Move only when seen by player
-        players = self.ecs.manage(components.Player)
-        viewsheds = self.ecs.manage(components.Viewshed)
         locations = self.ecs.manage(components.Location)
 
         actor_location = locations.get(actor)
-        for player, location, viewshed in self.ecs.join(players.entities, locations, viewsheds):
+        for player, is_player, location, viewshed in self.ecs.query(
+            components.Player, components.Location, components.Viewshed,
+        ):
             if not location.level_id == actor_location.level_id:
                 continue
 
-            if actor_location.position in viewshed.positions:
+            if viewshed.is_visible(actor_location.position):
                 return True
 
         return False
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""Headless benchmarks, reference for game loop performance regressions.
+
+Usage:
+
+    python -m rogal.bench sim --turns 1000
+    python -m rogal.bench sim --generator bsp --seeds 1 --json bench.json
+    python -m rogal.bench sim --fov numpy_symmetric --fov-workers 4
+
+"""
+
+import argparse
+import json
+import logging
+import time
+import uuid
+
+from .ecs import ECS
+
+from .data.loaders import DataLoader
+from .tiles.tilesets import Tileset
+
+from .procgen.dungeons import RandomDungeonLevelGenerator, RogueGridLevelGenerator, BSPLevelGenerator
+
+from .ai import AI
+from .rng import rng
+from .utils import perf
+
+from . import components
+from . import fov
+from . import main
+
+
+log = logging.getLogger(__name__)
+
+
+LEVEL_GENERATORS = {
+    'random': RandomDungeonLevelGenerator,
+    'rogue': RogueGridLevelGenerator,
+    'bsp': BSPLevelGenerator,
+}
+
+SEEDS = [
+    uuid.UUID('5829028d-61c1-4e8d-ac96-26236d1fd6a1'),
+    uuid.UUID('dbe8c067-94cc-41ae-9afb-1392c85c1f76'),
+    uuid.UUID('aa43491d-ca4a-47de-a9bc-c2fa17c3a9ee'),
+]
+
+TURNS = 500
+TURNS_PER_LEVEL = 100
+
+
+class ScriptedPlayer(AI):
+
+    """Player moving in random directions, going to new level every turns_per_level turns."""
+
+    def __init__(self, ecs, turns_per_level=None):
+        super().__init__(ecs)
+        self.turns_per_level = turns_per_level
+        self.turns = 0
+
+    def take_action(self, actor, *args, **kwargs):
+        self.turns += 1
+        if self.turns_per_level and self.turns % self.turns_per_level == 0:
+            return self.insert_action(actor, components.WantsToChangeLevel, 0)
+        return self.random_direction_move(actor)
+
+
+def simulate(level_generator_cls, seed, turns, turns_per_level=None, max_workers=None,
+             fov_algorithm=None, fov_workers=None):
+    """Run game without any UI until player takes given number of turns."""
+    rng.seed(seed)
+
+    ecs = ECS(max_workers=max_workers)
+    ecs.resources.register(
+        tileset=Tileset(DataLoader(main.TILESET_DATA_FN)),
+    )
+    player = main.initialize_game(ecs, seed, level_generator_cls, fov_algorithm, fov_workers)
+    handler = ScriptedPlayer(ecs, turns_per_level)
+    ecs.manage(components.Actor).insert(player, handler)
+
+    perf.Perf.reset()
+    frames = 0
+    start = time.perf_counter()
+    while handler.turns < turns:
+        ecs.run_once()
+        frames += 1
+    elapsed = time.perf_counter() - start
+
+    return dict(
+        turns=handler.turns,
+        frames=frames,
+        elapsed=elapsed,
+        turns_per_sec=handler.turns / elapsed,
+        entities=len(ecs.entities),
+        levels=len(ecs.manage(components.Level)),
+        fov_cache=fov_cache_stats(ecs.resources.fov.cache),
+        perf=perf.Perf.get_stats(),
+    )
+
+
+def fov_cache_stats(cache):
+    if cache is None:
+        return None
+    return dict(
+        hits=cache.hits,
+        misses=cache.misses,
+        hit_ratio=cache.hit_ratio,
+        entries=len(cache),
+        nbytes=cache.nbytes,
+    )
+
+
+def print_result(name, result):
+    print(
+        f'{name}: {result["turns"]} turns, {result["frames"]} frames in {result["elapsed"]:.3f} sec '
+        f'- {result["turns_per_sec"]:.1f} turns/sec '
+        f'({result["levels"]} levels, {result["entities"]} entities)'
+    )
+    fov_cache = result['fov_cache']
+    if fov_cache:
+        print(
+            f'    FOV cache: {fov_cache["hits"]} hits, {fov_cache["misses"]} misses '
+            f'({fov_cache["hit_ratio"]:.1%}), {fov_cache["entries"]} entries, {fov_cache["nbytes"]} bytes'
+        )
+    systems_stats = [
+        (name, stats) for name, stats in result['perf'].items()
+        if name.endswith('.run()')
+    ]
+    systems_stats.sort(key=lambda name_stats: name_stats[1]['total'], reverse=True)
+    for name, stats in systems_stats:
+        print(
+            f'    {name:65s} {stats["total"]/result["elapsed"]:6.1%}   calls: {stats["calls"]:7d}   '
+            f'p50: {stats["p50"]*1000:8.3f}ms   p95: {stats["p95"]*1000:8.3f}ms   '
+            f'p99: {stats["p99"]*1000:8.3f}ms   max: {stats["max"]*1000:8.3f}ms'
+        )
+
+
+def sim(args):
+    results = {}
+    for generator_name in args.generator or sorted(LEVEL_GENERATORS.keys()):
+        for seed in SEEDS[:args.seeds]:
+            name = f'{generator_name}:{seed}'
+            result = simulate(
+                LEVEL_GENERATORS[generator_name], seed,
+                turns=args.turns,
+                turns_per_level=args.turns_per_level,
+                max_workers=args.workers,
+                fov_algorithm=args.fov,
+                fov_workers=args.fov_workers,
+            )
+            print_result(name, result)
+            results[name] = result
+
+    turns = sum(result['turns'] for result in results.values())
+    elapsed = sum(result['elapsed'] for result in results.values())
+    print(f'TOTAL: {turns} turns in {elapsed:.3f} sec - {turns/elapsed:.1f} turns/sec')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    sim_parser = subparsers.add_parser('sim', help='headless simulation of game loop')
+    sim_parser.add_argument(
+        '--generator', action='append', choices=sorted(LEVEL_GENERATORS.keys()),
+        help='level generator to use, may be used multiple times (default: all)',
+    )
+    sim_parser.add_argument(
+        '--seeds', type=int, default=len(SEEDS),
+        help='number of fixed seeds to run with',
+    )
+    sim_parser.add_argument('--turns', type=int, default=TURNS)
+    sim_parser.add_argument('--turns-per-level', type=int, default=TURNS_PER_LEVEL)
+    sim_parser.add_argument(
+        '--workers', type=int, default=None,
+        help='number of threads running systems in parallel',
+    )
+    sim_parser.add_argument(
+        '--fov', choices=sorted(fov.ALGORITHMS.keys()), default=None,
+        help='FOV algorithm to use',
+    )
+    sim_parser.add_argument(
+        '--fov-workers', type=int, default=None,
+        help='number of threads calculating FOV',
+    )
+    sim_parser.add_argument('--json', help='dump results to JSON file')
+    sim_parser.set_defaults(func=sim)
+
+    args = parser.parse_args()
+    args.func(args)
+
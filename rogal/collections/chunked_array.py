@@ -0,0 +1,244 @@
+import logging
+
+import numpy as np
+
+
+log = logging.getLogger(__name__)
+
+
+CHUNK_SIZE = 32
+
+
+class ChunkedArray:
+
+    """2D array split into fixed size square chunks, allocated on first write.
+
+    Reading never allocates, values in untouched chunks are equal to fill_value. Supports
+    indexing used with level arrays: single (x, y) positions, rectangular slices (returning
+    dense copies, touching only chunks in range), and (xs, ys) tuples of index arrays.
+
+    Writing values equal to fill_value to untouched chunks doesn't allocate them.
+
+    """
+
+    __slots__ = ('shape', 'dtype', 'fill_value', 'chunk_size', 'chunks', 'writeable', )
+
+    def __init__(self, shape, dtype, fill_value=0, chunk_size=CHUNK_SIZE):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.fill_value = fill_value
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        self.writeable = True
+
+    def view(self, writeable=True):
+        """Return array sharing chunks with this one."""
+        view = ChunkedArray(self.shape, self.dtype, self.fill_value, self.chunk_size)
+        view.chunks = self.chunks
+        view.writeable = writeable
+        return view
+
+    def check_writeable(self):
+        if not self.writeable:
+            raise ValueError('assignment destination is read-only')
+
+    def fill(self, value):
+        """Fill whole array with given value, releasing all chunks."""
+        self.check_writeable()
+        self.chunks.clear()
+        self.fill_value = value
+
+    @property
+    def nbytes(self):
+        """Return number of bytes used by allocated chunks."""
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def allocate(self, chunk_key):
+        chunk = np.full((self.chunk_size, self.chunk_size), self.fill_value, dtype=self.dtype)
+        self.chunks[chunk_key] = chunk
+        return chunk
+
+    def normalize_slices(self, key):
+        """Return (x1, x2, y1, y2) region for given tuple of slices."""
+        region = []
+        for index, dim in zip(key, self.shape):
+            start, stop, step = index.indices(dim)
+            if step != 1:
+                raise IndexError(f'Only continuous slices are supported: {index}')
+            region.extend([start, max(start, stop)])
+        return region
+
+    def iter_chunks(self, x1, x2, y1, y2):
+        """Yield chunk keys, chunk slices and region slices of chunks intersecting given region."""
+        size = self.chunk_size
+        for chunk_x in range(x1 // size, (x2-1) // size + 1):
+            chunk_x1 = chunk_x*size
+            from_x, to_x = max(x1, chunk_x1), min(x2, chunk_x1+size)
+            for chunk_y in range(y1 // size, (y2-1) // size + 1):
+                chunk_y1 = chunk_y*size
+                from_y, to_y = max(y1, chunk_y1), min(y2, chunk_y1+size)
+                yield (
+                    (chunk_x, chunk_y),
+                    (slice(from_x-chunk_x1, to_x-chunk_x1), slice(from_y-chunk_y1, to_y-chunk_y1)),
+                    (slice(from_x-x1, to_x-x1), slice(from_y-y1, to_y-y1)),
+                )
+
+    def get_region(self, x1, x2, y1, y2):
+        region = np.full((x2-x1, y2-y1), self.fill_value, dtype=self.dtype)
+        if x1 >= x2 or y1 >= y2:
+            return region
+        for chunk_key, chunk_slices, region_slices in self.iter_chunks(x1, x2, y1, y2):
+            chunk = self.chunks.get(chunk_key)
+            if chunk is not None:
+                region[region_slices] = chunk[chunk_slices]
+        return region
+
+    def set_region(self, x1, x2, y1, y2, values):
+        self.check_writeable()
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), (x2-x1, y2-y1))
+        if x1 >= x2 or y1 >= y2:
+            return
+        for chunk_key, chunk_slices, region_slices in self.iter_chunks(x1, x2, y1, y2):
+            block = values[region_slices]
+            chunk = self.chunks.get(chunk_key)
+            if chunk is None:
+                if np.all(block == self.fill_value):
+                    continue
+                chunk = self.allocate(chunk_key)
+            chunk[chunk_slices] = block
+
+    def or_region(self, position, values):
+        """Bitwise OR values with region starting at given position (clipped to array bounds)."""
+        self.check_writeable()
+        width, height = self.shape
+        x, y = position
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x+values.shape[0], width), min(y+values.shape[1], height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        values = values[x1-x:x2-x, y1-y:y2-y]
+        for chunk_key, chunk_slices, region_slices in self.iter_chunks(x1, x2, y1, y2):
+            block = values[region_slices]
+            if not block.any():
+                continue
+            chunk = self.chunks.get(chunk_key)
+            if chunk is None:
+                chunk = self.allocate(chunk_key)
+            chunk[chunk_slices] |= block
+
+    def chunks_index(self, xs, ys):
+        """Yield chunk keys, and masks of positions in these chunks."""
+        size = self.chunk_size
+        chunks_xs, chunks_ys = xs // size, ys // size
+        for chunk_x, chunk_y in set(zip(chunks_xs.tolist(), chunks_ys.tolist())):
+            yield (chunk_x, chunk_y), (chunks_xs == chunk_x) & (chunks_ys == chunk_y)
+
+    def check_bounds(self, x, y):
+        width, height = self.shape
+        if not (0 <= x < width and 0 <= y < height):
+            raise IndexError(f'Position ({x}, {y}) out of bounds {self.shape}')
+
+    def __getitem__(self, key):
+        x, y = key
+        if isinstance(x, slice) and isinstance(y, slice):
+            return self.get_region(*self.normalize_slices(key))
+
+        if isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+            xs, ys = np.broadcast_arrays(x, y)
+            values = np.full(xs.shape, self.fill_value, dtype=self.dtype)
+            size = self.chunk_size
+            for chunk_key, mask in self.chunks_index(xs, ys):
+                chunk = self.chunks.get(chunk_key)
+                if chunk is not None:
+                    values[mask] = chunk[xs[mask] % size, ys[mask] % size]
+            return values
+
+        self.check_bounds(x, y)
+        chunk = self.chunks.get((x // self.chunk_size, y // self.chunk_size))
+        if chunk is None:
+            return self.dtype.type(self.fill_value)
+        return chunk[x % self.chunk_size, y % self.chunk_size]
+
+    def or_at(self, index, values):
+        """Bitwise OR values on positions from (xs, ys) index, positions might be repeated."""
+        xs, ys = index
+        if not len(xs):
+            return
+        height = self.shape[1]
+        positions, inverse = np.unique(xs*height + ys, return_inverse=True)
+        combined = np.zeros(len(positions), dtype=self.dtype)
+        np.bitwise_or.at(combined, inverse, values)
+        index = (positions // height, positions % height)
+        self[index] = self[index] | combined
+
+    def __setitem__(self, key, values):
+        self.check_writeable()
+        x, y = key
+        if isinstance(x, slice) and isinstance(y, slice):
+            return self.set_region(*self.normalize_slices(key), values)
+
+        if isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+            xs, ys = np.broadcast_arrays(x, y)
+            values = np.broadcast_to(np.asarray(values, dtype=self.dtype), xs.shape)
+            size = self.chunk_size
+            for chunk_key, mask in self.chunks_index(xs, ys):
+                chunk = self.chunks.get(chunk_key)
+                if chunk is None:
+                    if np.all(values[mask] == self.fill_value):
+                        continue
+                    chunk = self.allocate(chunk_key)
+                chunk[xs[mask] % size, ys[mask] % size] = values[mask]
+            return
+
+        self.check_bounds(x, y)
+        chunk_key = (x // self.chunk_size, y // self.chunk_size)
+        chunk = self.chunks.get(chunk_key)
+        if chunk is None:
+            if values == self.fill_value:
+                return
+            chunk = self.allocate(chunk_key)
+        chunk[x % self.chunk_size, y % self.chunk_size] = values
+
+    def __ior__(self, values):
+        """Bitwise OR with dense array of the same shape."""
+        self.or_region((0, 0), values)
+        return self
+
+    def to_array(self):
+        """Return dense copy of whole array."""
+        width, height = self.shape
+        return self.get_region(0, width, 0, height)
+
+    def __array__(self, dtype=None):
+        array = self.to_array()
+        if dtype is not None:
+            array = array.astype(dtype)
+        return array
+
+
+def map_chunks(func, *arrays, dtype):
+    """Return ChunkedArray with func applied to chunks of given arrays (of the same shape).
+
+    Only chunks allocated in any of arrays are calculated, fill_value of returned array is
+    func applied to fill_values. Calculated chunks equal to that fill_value are not allocated.
+
+    """
+    first = arrays[0]
+    fills = [np.full((1, 1), array.fill_value, dtype=array.dtype) for array in arrays]
+    fill_value = np.asarray(func(*fills), dtype=dtype)[0, 0]
+    mapped = ChunkedArray(first.shape, dtype, fill_value, first.chunk_size)
+    size = first.chunk_size
+    chunk_keys = set().union(*[array.chunks.keys() for array in arrays])
+    for chunk_key in chunk_keys:
+        chunks = []
+        for array in arrays:
+            chunk = array.chunks.get(chunk_key)
+            if chunk is None:
+                chunk = np.full((size, size), array.fill_value, dtype=array.dtype)
+            chunks.append(chunk)
+        chunk = np.asarray(func(*chunks), dtype=dtype)
+        if np.all(chunk == fill_value):
+            continue
+        mapped.chunks[chunk_key] = chunk
+    return mapped
+
@@ -6,9 +6,11 @@ import numpy as np
 from .ecs import Component
 from .ecs.components import Flag, IntFlag, Int, Counter, FloatComponent, String, EntityReference, EntitiesRefs
 from .ecs.components import component_type
+from .collections.chunked_array import ChunkedArray
+from . import dtypes
 from . import flags
 from .geometry import Direction, Position, Size, WithPositionMixin, WithVectorMixin
-from .geometry.rectangle import Rectangular
+from .geometry.rectangle import Rectangle, Rectangular
 from . import stats
 from .tiles import RenderOrder
 from . import terrain
@@ -22,10 +24,8 @@ from . import terrain
 # Flags
 
 BlocksMovement = IntFlag('BlocksMovement', flags.Flag.BLOCKS_MOVEMENT)
-BlocksMovementChanged = Flag('BlocksMovementChanged')
 
 BlocksVision = IntFlag('BlocksVision', flags.Flag.BLOCKS_VISION)
-BlocksVisionChanged = Flag('BlocksVisionChanged')
 
 
 # Entity type
@@ -68,7 +68,7 @@ class Level(Component, Rectangular):
 
     def serialize(self):
         terrain = []
-        for row in self.terrain.T:
+        for row in np.asarray(self.terrain).T:
             terrain.append(','.join([f'{terrain_id:02x}' for terrain_id in row]))
         data = {
             str(self.id): dict(
@@ -154,33 +154,75 @@ class Renderable(Component):
 
 # TODO: needs_update as separate Flag
 class Viewshed(Component):
-    __slots__ = ('view_range', 'fov', '_positions', 'entities', 'needs_update', )
+    __slots__ = ('view_range', 'fov', 'offset', 'entities', 'needs_update', )
     params = ('view_range', )
 
     def __init__(self, view_range):
         self.view_range = view_range # TODO: Use stats Attribute so we can easily alter view_range.modifier?
+        # NOTE: fov covers only window around viewer, with top-left corner at offset
         self.fov = None
-        self._positions = set()
+        self.offset = Position.ZERO
         self.entities = set() # TODO: Needs to be moved somewhere else
         self.needs_update = True
 
     def invalidate(self):
         self.fov = None
-        self._positions.clear()
         self.needs_update = True
 
-    def update(self, fov):
+    def update(self, fov, offset=Position.ZERO):
         self.fov = fov
+        self.offset = offset
         self.needs_update = False
 
+    def covered(self, coverage):
+        """Return fov projected onto given rectangular part of the level."""
+        covered = np.zeros(coverage.size, dtype=bool)
+        if self.fov is None:
+            return covered
+        common = Rectangle(self.offset, Size(*self.fov.shape)) & coverage
+        if common:
+            covered[
+                common.x-coverage.x : common.x2-coverage.x,
+                common.y-coverage.y : common.y2-coverage.y
+            ] = self.fov[
+                common.x-self.offset.x : common.x2-self.offset.x,
+                common.y-self.offset.y : common.y2-self.offset.y
+            ]
+        return covered
+
+    def project(self, size):
+        """Return fov projected onto level of given size."""
+        return self.covered(Rectangle(Position.ZERO, size))
+
     @property
     def positions(self):
-        if self.fov is not None and \
-           not self._positions:
-            self._positions.update(
-                Position(x, y) for x, y in np.transpose(self.fov.nonzero())
-            )
-        return self._positions
+        """Return (xs, ys) index arrays of visible positions."""
+        if self.fov is None:
+            return (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+        xs, ys = self.fov.nonzero()
+        return (xs + self.offset.x, ys + self.offset.y)
+
+    def visible(self, index):
+        """Return boolean array telling which of positions from (xs, ys) index are visible."""
+        xs, ys = index
+        xs = np.asarray(xs) - self.offset.x
+        ys = np.asarray(ys) - self.offset.y
+        if self.fov is None:
+            return np.zeros(xs.shape, dtype=bool)
+        width, height = self.fov.shape
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        visible = np.zeros(xs.shape, dtype=bool)
+        visible[inside] = self.fov[xs[inside], ys[inside]]
+        return visible
+
+    def is_visible(self, position):
+        """Return True if given position is visible."""
+        if self.fov is None:
+            return False
+        x = position.x - self.offset.x
+        y = position.y - self.offset.y
+        width, height = self.fov.shape
+        return 0 <= x < width and 0 <= y < height and bool(self.fov[x, y])
 
 
 # TODO: Instead of storing bool array of revealed,
@@ -200,30 +242,41 @@ class LevelMemory(Component):
             cls._SHARED[shared] = memory
         return memory
 
-    def update(self, level_id, fov):
-        if not level_id in self.revealed:
-            self.revealed[level_id] = fov == True
-        else:
-            self.revealed[level_id] |= fov
+    def update(self, level_id, size, fov, offset=Position.ZERO):
+        """Reveal positions from fov with top-left corner at offset on level of given size."""
+        revealed = self.revealed.get(level_id)
+        if revealed is None:
+            # NOTE: Chunks are allocated only when revealed
+            revealed = ChunkedArray(size, dtype=bool, fill_value=False)
+            self.revealed[level_id] = revealed
+        revealed.or_region(offset, fov)
+
+    def forget(self, level_id):
+        """Forget given level, return number of bytes reclaimed."""
+        revealed = self.revealed.pop(level_id, None)
+        if revealed is None:
+            return 0
+        return revealed.nbytes
 
 
 Pool = component_type(Component, stats.Pool)
 
-HitPoints = Pool('HitPoints')
+HitPoints = Pool('HitPoints', dtype=dtypes.POOL_DT)
 
 
 Attribute = component_type(Component, stats.Attribute)
 
-Attack = Attribute('Attack')
-Defence = Attribute('Defence')
-MovementSpeed = Attribute('MovementSpeed')
+Attack = Attribute('Attack', dtype=dtypes.ATTRIBUTE_DT)
+Defence = Attribute('Defence', dtype=dtypes.ATTRIBUTE_DT)
+MovementSpeed = Attribute('MovementSpeed', dtype=dtypes.ATTRIBUTE_DT)
 
 
 # Actions queue
 
 ActsNow = Flag('ActsNow')
 
-WaitsForAction = Counter('WaitsForAction')
+# NOTE: Number of ticks to wait since inserted, actual scheduling is done by actions_queue.ActionsQueue
+WaitsForAction = Counter('WaitsForAction', dtype=dtypes.COUNTER_DT)
 
 
 class Actor(Component):
@@ -266,10 +319,6 @@ class WantsToMove(WithVectorMixin, Component):
         return f'<{self.name}={getattr(self.vector, "name", self.vector)}>'
 
 
-# TODO: HasMoved: from: Location, how: ModeOfTransport/MovementType
-HasMoved = Flag('HasMoved')
-
-
 WantsToChangeLevel = EntityReference('WantsToChangeLevel')
 
 
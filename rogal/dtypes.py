@@ -28,6 +28,9 @@ TILES_INDEXED_COLORS_DT = np.dtype([
 ])
 
 
+ENTITY_DT = np.dtype('u8')
+
+
 TERRAIN_DT = np.dtype('u1')
 
 
@@ -40,3 +43,21 @@ MOVEMENT_COST_DT = np.dtype([
     ('swim',    'u2'),
 ])
 
+
+# Columnar components
+
+COUNTER_DT = np.dtype([
+    ('value',       'i4'),
+])
+
+# NOTE: stats.Pool stores value in _value, value property clamps it to max_value
+POOL_DT = np.dtype([
+    ('_value',      'i4'),
+    ('max_value',   'i4'),
+])
+
+ATTRIBUTE_DT = np.dtype([
+    ('base',        'i4'),
+    ('modifier',    'i4'),
+])
+
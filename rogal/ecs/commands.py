@@ -0,0 +1,63 @@
+import collections
+import functools
+import logging
+
+
+log = logging.getLogger(__name__)
+
+
+class Commands:
+
+    """Buffer of deferred structural changes (creating / removing entities and components).
+
+    Commands are applied in order they were issued, on flush(). SystemsManager flushes
+    commands after running each System, so it's safe to use them while iterating over joins.
+
+    """
+
+    def __init__(self, ecs):
+        self.ecs = ecs
+        self._commands = collections.deque()
+
+    def create(self, *components):
+        """Create Entity with given components, return it's ID right away."""
+        entity = self.ecs.allocate()
+        self._commands.append(functools.partial(
+            self.ecs.create, *components, entity_id=entity,
+        ))
+        return entity
+
+    def insert(self, entity, component_type, *args, **kwargs):
+        """Insert component of given type (or Component instance) to Entity."""
+        if not isinstance(component_type, type):
+            # Component instance (like Flag) instead of type
+            kwargs['component'] = component_type
+        manager = self.ecs.manage(component_type)
+        self._commands.append(functools.partial(
+            manager.insert, entity, *args, **kwargs,
+        ))
+
+    def remove(self, entity, *component_types):
+        """Remove components of given types from Entity."""
+        for component_type in component_types:
+            manager = self.ecs.manage(component_type)
+            self._commands.append(functools.partial(
+                manager.discard, entity,
+            ))
+
+    def destroy(self, *entities):
+        """Remove entities with all their components."""
+        self._commands.append(functools.partial(
+            self.ecs.remove, *entities,
+        ))
+
+    def flush(self):
+        """Apply all buffered commands."""
+        # NOTE: Commands issued while flushing are applied as well
+        while self._commands:
+            command = self._commands.popleft()
+            command()
+
+    def __len__(self):
+        return len(self._commands)
+
@@ -96,11 +96,17 @@ def IntFlag(name, value):
     return type(name, bases, attrs)(value)
 
 
-def _type_factory(name, bases):
-    """Returns class with given name, inheriting from bases."""
+def _type_factory(name, bases, dtype=None):
+    """Returns class with given name, inheriting from bases.
+
+    If dtype is provided components will be stored in ColumnarComponentManager.
+
+    """
     attrs = dict(
         __slots__=(),
     )
+    if dtype is not None:
+        attrs['dtype'] = dtype
     return type(name, bases, attrs)
 
 def component_type(*bases):
@@ -1,11 +1,15 @@
 import collections
-import functools
+import itertools
 import logging
+import threading
 import uuid
 
+import numpy as np
+
 from ..collections.attrdict import AttrDict
 from ..utils import perf
 
+from .commands import Commands
 from .run_state import RunState
 
 
@@ -18,23 +22,42 @@ class Entity(int):
 
     All data related to given Entity is stored in ComponentManagers.
 
+    IDs allocated by EntityIdAllocator are compact, generational IDs: slot index in lower INDEX_BITS,
+    and generation of given slot in higher bits. Explicit IDs (like level IDs based on UUIDs,
+    or terrain IDs) are used as they are.
+
     """
 
     __slots__ = ()
 
-    def __new__(cls, entity_id=None):
-        if entity_id is None:
-            entity_id = uuid.uuid4().int
+    INDEX_BITS = 32
+    INDEX_MASK = (1 << INDEX_BITS) - 1
+
+    def __new__(cls, entity_id):
         if isinstance(entity_id, bytes):
             entity_id = int.from_bytes(entity_id, 'big')
         return super().__new__(cls, entity_id)
 
+    @property
+    def index(self):
+        return self & self.INDEX_MASK
+
+    @property
+    def generation(self):
+        return self >> self.INDEX_BITS
+
+    @property
+    def is_compact(self):
+        return self.bit_length() <= 64
+
     @property
     def bytes(self):
         return self.to_bytes(16, 'big')
 
     @property
     def short_id(self):
+        if self.is_compact:
+            return f'{self.index}.{self.generation}'
         hex = '%032x' % self
         return hex[:8]
 
@@ -42,11 +65,86 @@ class Entity(int):
         return self.short_id
 
     def __repr__(self):
+        if self.is_compact:
+            return f'<Entity id={self.short_id}>'
         hex = '%032x' % self
         return '<Entity id="%s-%s-%s-%s-%s">' % (
             hex[:8], hex[8:12], hex[12:16], hex[16:20], hex[20:])
 
 
+class EntityIdAllocator:
+
+    """Allocator of dense, generational Entity IDs.
+
+    Slots of released entities are recycled with increased generation,
+    so stale references won't be equal to the new Entity using the same slot.
+
+    UUIDs are generated only on demand, when Entity needs stable external name.
+
+    """
+
+    # NOTE: Slots reserved for small, explicit IDs (see: terrain.get_terrain_id())
+    RESERVED = 256
+    GENERATION_MASK = (1 << 32) - 1
+
+    def __init__(self):
+        self.generations = [] # generation per slot, starting with RESERVED slot
+        self.free = collections.deque()
+        self.uuids = {}
+        # NOTE: Systems running in parallel might allocate entities (see: ecs.commands.create())
+        self.lock = threading.Lock()
+
+    def get_slot(self, entity):
+        """Return slot of given Entity or None if it's not allocated with this allocator."""
+        if entity >> 64:
+            return None
+        slot = (entity & Entity.INDEX_MASK) - self.RESERVED
+        if not 0 <= slot < len(self.generations):
+            return None
+        return slot
+
+    def is_alive(self, entity):
+        """Return True if Entity was allocated and not yet released."""
+        slot = self.get_slot(entity)
+        if slot is None:
+            return False
+        return self.generations[slot] == entity >> Entity.INDEX_BITS
+
+    def allocate(self):
+        """Return new Entity."""
+        with self.lock:
+            if self.free:
+                index = self.free.popleft()
+                generation = self.generations[index-self.RESERVED]
+            else:
+                index = self.RESERVED + len(self.generations)
+                generation = 0
+                self.generations.append(generation)
+        return Entity(generation << Entity.INDEX_BITS | index)
+
+    def release(self, entity):
+        """Release Entity, it's slot will be reused."""
+        with self.lock:
+            if not self.is_alive(entity):
+                return
+            slot = self.get_slot(entity)
+            generation = entity >> Entity.INDEX_BITS
+            self.generations[slot] = (generation + 1) & self.GENERATION_MASK
+            self.free.append(slot + self.RESERVED)
+            self.uuids.pop(entity, None)
+
+    def uuid(self, entity):
+        """Return UUID of given Entity."""
+        if not self.is_alive(entity):
+            # Explicit ID, just use it's value
+            return uuid.UUID(int=entity)
+        entity_uuid = self.uuids.get(entity)
+        if entity_uuid is None:
+            entity_uuid = uuid.uuid4()
+            self.uuids[entity] = entity_uuid
+        return entity_uuid
+
+
 class Component:
 
     """Component that holds some data.
@@ -55,11 +153,13 @@ class Component:
     All logic should be handled in Systems!
 
     params - values that are used by constructor and serialization
+    dtype - numpy structured dtype, if set components are stored in ColumnarComponentManager
 
     """
 
     __slots__ = ()
     params = None
+    dtype = None
 
     @property
     def name(self):
@@ -107,18 +207,96 @@ class EntitiesSet(set):
         # NOTE: It's assumed that get() is called inside JoinIterator that already knows if entity is present
         return entity
 
+    def keys(self):
+        return self
+
     @property
     def entities(self):
         return self
 
 
+class Changes(collections.namedtuple(
+    'Changes', [
+        'added',
+        'removed',
+        'modified',
+    ])):
+
+    """Entities added, removed and modified since previous ChangesCursor.read()."""
+
+    __slots__ = ()
+
+    @property
+    def changed(self):
+        """Added or modified entities."""
+        return EntitiesSet(self.added | self.modified)
+
+    @property
+    def entities(self):
+        """All changed entities."""
+        return EntitiesSet(self.added | self.removed | self.modified)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified)
+
+
+class ChangesCursor:
+
+    """Changes of ComponentManager recorded since previous read().
+
+    Each consumer (System) should use it's own cursor.
+
+    """
+
+    __slots__ = ('added', 'removed', 'modified', )
+
+    def __init__(self):
+        self.added = EntitiesSet()
+        self.removed = EntitiesSet()
+        self.modified = EntitiesSet()
+
+    def on_added(self, entity):
+        if entity in self.removed:
+            # Removed and inserted again, consider it modified
+            self.removed.discard(entity)
+            self.modified.add(entity)
+        else:
+            self.added.add(entity)
+
+    def on_removed(self, entity):
+        if entity in self.added:
+            # Added and removed, nothing changed
+            self.added.discard(entity)
+        else:
+            self.removed.add(entity)
+        self.modified.discard(entity)
+
+    def on_modified(self, entity):
+        if not entity in self.added:
+            self.modified.add(entity)
+
+    def read(self):
+        """Return Changes since previous read."""
+        changes = Changes(self.added, self.removed, self.modified)
+        self.added = EntitiesSet()
+        self.removed = EntitiesSet()
+        self.modified = EntitiesSet()
+        return changes
+
+
 class ComponentManager(dict):
 
-    __slots__ = ('component_type', )
+    __slots__ = ('component_type', 'queries', 'cursors', 'entities_index', )
 
-    def __init__(self, component_type):
+    def __init__(self, component_type, entities_index=None):
         super().__init__()
         self.component_type = component_type
+        # Queries that needs to be notified about added / removed entities
+        self.queries = []
+        # Cursors recording changes
+        self.cursors = []
+        # Reverse index shared by all managers {entity: {component_type: manager, }, }
+        self.entities_index = entities_index
 
     @property
     def entities(self):
@@ -133,22 +311,82 @@ class ComponentManager(dict):
         # NOTE: Iterating over values dict directly boosted performance significantly!
         yield from self.items()
 
+    def on_added(self, entity):
+        """Called after entity was added to manager."""
+        if self.entities_index is not None:
+            managers = self.entities_index.get(entity)
+            if managers is None:
+                managers = self.entities_index[entity] = {}
+            managers[self.component_type] = self
+        for query in self.queries:
+            query.add(entity)
+        for cursor in self.cursors:
+            cursor.on_added(entity)
+
+    def on_removed(self, entity):
+        """Called after entity was removed from manager."""
+        if self.entities_index is not None:
+            managers = self.entities_index.get(entity)
+            if managers is not None:
+                managers.pop(self.component_type, None)
+                if not managers:
+                    del self.entities_index[entity]
+        for query in self.queries:
+            query.discard(entity)
+        for cursor in self.cursors:
+            cursor.on_removed(entity)
+
+    def mark_modified(self, *entities):
+        """Mark components of given entities as modified (for example after changing in place)."""
+        for entity in entities:
+            if not entity in self:
+                continue
+            for cursor in self.cursors:
+                cursor.on_modified(entity)
+
+    def track_changes(self):
+        """Return new ChangesCursor, recording all changes from now on."""
+        cursor = ChangesCursor()
+        self.cursors.append(cursor)
+        return cursor
+
     def insert(self, entity, *args, component=None, **kwargs):
         if component is not None and not isinstance(component, self.component_type):
             raise ValueError('Invalid component type!')
         if component is None:
             component = self.component_type(*args, **kwargs)
+        is_new = not entity in self
         self[entity] = component
+        if is_new:
+            self.on_added(entity)
+        else:
+            self.mark_modified(entity)
         return component
 
     def discard(self, entity):
-        # self.entities.discard(entity)
-        self.pop(entity, None)
+        if entity in self:
+            del self[entity]
+            self.on_removed(entity)
 
     def remove(self, *entities):
         for entity in entities:
             self.discard(entity)
 
+    def clear(self):
+        if self.entities_index is not None:
+            for entity in self.keys():
+                managers = self.entities_index.get(entity)
+                if managers is not None:
+                    managers.pop(self.component_type, None)
+                    if not managers:
+                        del self.entities_index[entity]
+        for cursor in self.cursors:
+            for entity in self.keys():
+                cursor.on_removed(entity)
+        super().clear()
+        for query in self.queries:
+            query.clear()
+
     def __rand__(self, other):
         return other & self.keys()
 
@@ -156,6 +394,158 @@ class ComponentManager(dict):
         return f'<{self.__class__.__name__}({self.component_type.__name__})>'
 
 
+class ColumnField:
+
+    """Descriptor of component field stored in ColumnarComponentManager.
+
+    Reads and writes go straight to the slot of component's entity, writes mark it as modified.
+
+    """
+
+    __slots__ = ('name', )
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, component, owner=None):
+        if component is None:
+            return self
+        manager = component._manager
+        return manager.data[self.name][dict.__getitem__(manager, component._entity)].item()
+
+    def __set__(self, component, value):
+        manager = component._manager
+        manager.data[self.name][dict.__getitem__(manager, component._entity)] = value
+        manager.mark_modified(component._entity)
+
+
+class ColumnarComponentManager(ComponentManager):
+
+    """ComponentManager storing numeric fields of components in NumPy arrays.
+
+    Fields described by component_type.dtype are kept in structured array, indexed by dense slots,
+    dict itself maps entity -> slot. Slots are kept packed, so column(name) is a view
+    on all stored values and can be used for bulk, vectorized updates.
+
+    Names of dtype fields must match names of attributes storing component's state.
+    Components returned by get() and iteration are views bound to stored values, so changing
+    them in place (like hit_points -= damage) changes stored values, and marks them as modified.
+    Views are valid as long as component is not removed from manager.
+
+    NOTE: Immutable components (int, float subclasses) are returned as copies.
+
+    """
+
+    __slots__ = ('data', 'slots', 'bound_type', )
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, component_type, entities_index=None):
+        super().__init__(component_type, entities_index)
+        self.data = np.zeros(self.INITIAL_CAPACITY, dtype=component_type.dtype)
+        # Entities stored in given slot
+        self.slots = []
+        self.bound_type = self.create_bound_type(component_type)
+
+    @staticmethod
+    def create_bound_type(component_type):
+        """Return subclass of component_type with fields bound to stored values."""
+        if issubclass(component_type, (int, float, str, tuple)):
+            # NOTE: Can't be changed in place, and can't have nonempty __slots__
+            return None
+        for name in component_type.dtype.names:
+            if not hasattr(component_type, name):
+                raise ValueError(f'{component_type.__name__} has no attribute for dtype field: {name!r}')
+        attrs = {name: ColumnField(name) for name in component_type.dtype.names}
+        attrs['__slots__'] = ('_manager', '_entity', )
+        params = component_type.params
+        if params is None:
+            params = component_type.__slots__
+        attrs['params'] = params
+        return type(component_type.__name__, (component_type, ), attrs)
+
+    def get_component(self, slot):
+        if self.bound_type is None:
+            return self.component_type(*self.data[slot].item())
+        component = self.bound_type.__new__(self.bound_type)
+        component._manager = self
+        component._entity = self.slots[slot]
+        return component
+
+    def get(self, entity, default=None):
+        slot = super().get(entity)
+        if slot is None:
+            return default
+        return self.get_component(slot)
+
+    def __getitem__(self, entity):
+        return self.get_component(super().__getitem__(entity))
+
+    def __setitem__(self, entity, component):
+        self.insert(entity, component=component)
+
+    def __iter__(self):
+        for slot, entity in enumerate(self.slots):
+            yield entity, self.get_component(slot)
+
+    def items(self):
+        yield from self
+
+    def values(self):
+        for slot in range(len(self.slots)):
+            yield self.get_component(slot)
+
+    def insert(self, entity, *args, component=None, **kwargs):
+        if component is not None and not isinstance(component, self.component_type):
+            raise ValueError('Invalid component type!')
+        if component is None:
+            component = self.component_type(*args, **kwargs)
+        slot = super().get(entity)
+        if slot is None:
+            slot = len(self.slots)
+            if slot >= len(self.data):
+                data = np.zeros(len(self.data)*2, dtype=self.data.dtype)
+                data[:slot] = self.data
+                self.data = data
+            self.slots.append(entity)
+            dict.__setitem__(self, entity, slot)
+            self.on_added(entity)
+        else:
+            self.mark_modified(entity)
+        self.data[slot] = tuple(getattr(component, name) for name in self.data.dtype.names)
+        return component
+
+    def discard(self, entity):
+        slot = self.pop(entity, None)
+        if slot is None:
+            return
+        # Move last slot into freed one, to keep slots packed
+        last = len(self.slots) - 1
+        if slot != last:
+            moved = self.slots[last]
+            self.data[slot] = self.data[last]
+            self.slots[slot] = moved
+            dict.__setitem__(self, moved, slot)
+        self.slots.pop()
+        self.on_removed(entity)
+
+    def clear(self):
+        super().clear()
+        self.slots.clear()
+
+    def column(self, name):
+        """Return view of values of given field, ordered by slots.
+
+        NOTE: Changes made using returned view are not tracked, use mark_modified() if needed.
+
+        """
+        return self.data[name][:len(self.slots)]
+
+    def entities_where(self, mask):
+        """Return entities for slots with True values in given mask."""
+        return EntitiesSet(itertools.compress(self.slots, mask))
+
+
 class JoinIterator:
 
     """Iterate through values of combined ComponentManagers and EntitiesSets
@@ -181,13 +571,15 @@ class JoinIterator:
         # ])
 
         entities = None
-        for manager in sorted(self.managers, key=lambda m: len(m)):
+        for manager in sorted(self.managers, key=len):
             if manager is self.ignore:
                 continue
             if entities is None:
-                entities = EntitiesSet(manager.entities)
+                # NOTE: No need to copy, intersection returns new set. When iterating over
+                #       single manager use ecs.commands for any structural changes!
+                entities = manager.keys()
                 continue
-            entities &= manager
+            entities = entities & manager.keys()
 
         # TODO: Consider filtering out FlagComponent no need to have element that is always True
         for entity in entities:
@@ -198,15 +590,81 @@ class JoinIterator:
             yield values
 
 
+class Query:
+
+    """Persistent join of ComponentManagers.
+
+    Entities present in all managers are kept up to date on insert / removal,
+    so iterating costs O(matches), not O(sum of managers sizes).
+
+    """
+
+    __slots__ = ('managers', 'entities', )
+
+    def __init__(self, *managers):
+        self.managers = managers
+        smallest = min(self.managers, key=len)
+        self.entities = EntitiesSet(
+            entity for entity in smallest.keys()
+            if all(entity in manager for manager in self.managers)
+        )
+        for manager in self.managers:
+            manager.queries.append(self)
+
+    def add(self, entity):
+        if all(entity in manager for manager in self.managers):
+            self.entities.add(entity)
+
+    def discard(self, entity):
+        self.entities.discard(entity)
+
+    def clear(self):
+        self.entities.clear()
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __contains__(self, entity):
+        return entity in self.entities
+
+    def filter(self, entities):
+        """Yield [entity, component, ...] lists, but only for given entities."""
+        for entity in self.entities & entities:
+            yield [entity, *[manager.get(entity) for manager in self.managers]]
+
+    def __iter__(self):
+        """Yield [entity, component, ...] lists for all matching entities."""
+        # NOTE: Iterate over a copy, as managers might be changed while iterating
+        for entity in list(self.entities):
+            yield [entity, *[manager.get(entity) for manager in self.managers]]
+
+    def __repr__(self):
+        managers = ', '.join(manager.component_type.__name__ for manager in self.managers)
+        return f'<{self.__class__.__name__}({managers})>'
+
+
 class System:
 
+    """System - implements logic operating on components.
+
+    READS / WRITES - component types and resources names used by system,
+                     used by ParallelSystemsManager to run independent systems in parallel.
+                     Leave WRITES as None if system might change anything, including
+                     components inserted / removed, or entities destroyed, using ecs.commands.
+                     Resources with lazily built caches (like 'spatial' and 'fov') are
+                     changed even when only queried, declare them in WRITES.
+
+    """
+
     INCLUDE_STATES = set()
     EXCLUDE_STATES = set()
 
+    READS = None
+    WRITES = None
+
     def __init__(self, ecs):
         self.ecs = ecs
 
-    @functools.lru_cache
     def should_run(self, state):
         """Return True if system should run with given RunState."""
         if self.EXCLUDE_STATES and state in self.EXCLUDE_STATES:
@@ -224,30 +682,35 @@ class System:
 
 class SystemsManager:
 
-    def __init__(self):
+    def __init__(self, commands):
+        self.commands = commands
         self.systems = []
+        # Precompiled, ordered lists of systems that should run with given RunState
+        self.schedules = {run_state: [] for run_state in RunState}
         self.run_state = RunState.PRE_RUN # TODO: RENDER or WAIT_FOR_INPUT
         self.next_run_state = None
 
     def register(self, *systems):
         for system in systems:
             self.systems.append(system)
+            for run_state, schedule in self.schedules.items():
+                if system.should_run(run_state):
+                    schedule.append(system)
 
     def run(self):
         # Run all systems that should run with given run_state
-        systems = []
-        for system in self.systems:
-            if not system.should_run(self.run_state):
-                continue
+        for system in self.schedules[self.run_state]:
             with perf.Perf(system.run):
                 system.run()
-            systems.append(system)
-        log.debug(f'systems.run({self.run_state.name}): {systems}')
+            # Apply structural changes requested by system
+            if self.commands:
+                self.commands.flush()
 
         # Change run_state AFTER running all systems
         if self.next_run_state:
             self.run_state = self.next_run_state
             self.next_run_state = None
+            log.debug(f'systems.run({self.run_state.name}): {self.schedules[self.run_state]}')
 
     def __iter__(self):
         yield from self.systems
@@ -271,10 +734,19 @@ class ECS:
 
     """
 
-    def __init__(self):
+    def __init__(self, max_workers=None):
         self.entities = EntitiesSet()
+        self._entities_ids = EntityIdAllocator()
         self._components = {} # {component_type: ComponentManager(component_type), }
-        self._systems = SystemsManager()
+        self._entities_components = {} # {entity: {component_type: ComponentManager(component_type), }, }
+        self._queries = {} # {(component_type, ...): Query(manager, ...), }
+        self.commands = Commands(self)
+        if max_workers:
+            # Run independent systems in parallel
+            from .scheduler import ParallelSystemsManager
+            self._systems = ParallelSystemsManager(self.commands, max_workers)
+        else:
+            self._systems = SystemsManager(self.commands)
         self.resources = ResourcesManager()
 
     @property
@@ -293,9 +765,16 @@ class ECS:
     def next_state(self):
         return self._systems.next_run_state
 
+    def allocate(self):
+        """Return new Entity ID, without adding it to ECS (see: ecs.commands.create())."""
+        return self._entities_ids.allocate()
+
     def create(self, *components, entity_id=None):
         """Create Entity with given components."""
-        entity = Entity(entity_id)
+        if entity_id is None:
+            entity = self._entities_ids.allocate()
+        else:
+            entity = Entity(entity_id)
         self.entities.add(entity)
         for component in components:
             if component is None:
@@ -310,25 +789,34 @@ class ECS:
             component_type = type(component_type)
         component_manager = self._components.get(component_type)
         if component_manager is None:
-            component_manager = ComponentManager(component_type)
+            if getattr(component_type, 'dtype', None) is not None:
+                manager_cls = ColumnarComponentManager
+            else:
+                manager_cls = ComponentManager
+            component_manager = manager_cls(component_type, self._entities_components)
             self._components[component_type] = component_manager
         return component_manager
 
     def get_components(self, entity):
         """Return list of all components for given Entity."""
         components = []
-        for component_manager in self._components.values():
-            component = component_manager.get(entity)
-            if component:
-                components.append(component)
+        for component_manager in self._entities_components.get(entity, {}).values():
+            components.append(component_manager.get(entity))
         return components
 
     def remove(self, *entities):
         """Remove Entity."""
         for entity in entities:
-            for component_manager in self._components.values():
+            # NOTE: Only managers that actually contain given entity
+            component_managers = self._entities_components.pop(entity, {})
+            for component_manager in component_managers.values():
                 component_manager.discard(entity)
             self.entities.discard(entity)
+            self._entities_ids.release(entity)
+
+    def get_uuid(self, entity):
+        """Return UUID of given Entity, generated when needed for serialization or as an external name."""
+        return self._entities_ids.uuid(entity)
 
     def join(self, *managers):
         """Return iterator over values of multiple managers.
@@ -338,14 +826,27 @@ class ECS:
         """
         yield from JoinIterator(self.entities, *managers)
 
+    def query(self, *component_types):
+        """Return Query joining managers of given Components.
+
+        Queries are cached, so it's cheap to call it on each System run.
+
+        """
+        query = self._queries.get(component_types)
+        if query is None:
+            query = Query(*[self.manage(component_type) for component_type in component_types])
+            self._queries[component_types] = query
+        return query
+
     def register(self, *systems):
         """Register System."""
         self._systems.register(*systems)
 
     def run_once(self, *args, **kwargs):
         """Run Systems for given RunState."""
-        with perf.Perf(self._systems.run):
-            self._systems.run(*args, **kwargs)
+        with perf.Tracer.frame(run_state=self.run_state.name):
+            with perf.Perf(self._systems.run):
+                self._systems.run(*args, **kwargs)
 
     def run(self):
         # Should be named join() as in Thread.join() 
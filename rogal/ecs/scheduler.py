@@ -0,0 +1,104 @@
+import concurrent.futures
+import logging
+
+from ..utils import perf
+
+from .core import Component, SystemsManager
+
+
+log = logging.getLogger(__name__)
+
+
+def normalize_access(access):
+    """Return set of declared component types and resources names."""
+    if access is None:
+        return None
+    return {
+        type(item) if isinstance(item, Component) else item
+        for item in access
+    }
+
+
+def is_conflicting(system, other):
+    """Return True if systems can't run in parallel."""
+    reads, writes = system.access
+    other_reads, other_writes = other.access
+    if None in (reads, writes, other_reads, other_writes):
+        # Undeclared access, might touch anything
+        return True
+    return bool(
+        writes & (other_reads | other_writes) or
+        other_writes & reads
+    )
+
+
+class ParallelSystemsManager(SystemsManager):
+
+    """SystemsManager running independent systems in parallel on a thread pool.
+
+    Systems declare component types and resources names they READS and WRITES.
+    For each RunState systems are grouped into stages, system is placed in the first stage
+    after all previously registered systems it conflicts with. Systems without declarations
+    (READS or WRITES left as None) conflict with everything, and are always run on main thread.
+
+    Commands are flushed after each stage.
+
+    """
+
+    def __init__(self, commands, max_workers=None):
+        super().__init__(commands)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='systems',
+        )
+        self.stages = {run_state: [] for run_state in self.schedules}
+
+    def compile_stages(self, schedule):
+        """Return list of stages (lists of systems) for given schedule."""
+        stages = []
+        for system in schedule:
+            stage_index = 0
+            for index, stage in enumerate(stages):
+                if any(is_conflicting(system, other) for other in stage):
+                    stage_index = index + 1
+            if stage_index == len(stages):
+                stages.append([])
+            stages[stage_index].append(system)
+        return stages
+
+    def register(self, *systems):
+        for system in systems:
+            system.access = (
+                normalize_access(system.READS),
+                normalize_access(system.WRITES),
+            )
+        super().register(*systems)
+        for run_state, schedule in self.schedules.items():
+            self.stages[run_state] = self.compile_stages(schedule)
+            log.debug(f'stages({run_state.name}): {self.stages[run_state]}')
+
+    def run_system(self, system):
+        with perf.Perf(system.run):
+            system.run()
+
+    def run(self):
+        for stage in self.stages[self.run_state]:
+            if len(stage) == 1:
+                self.run_system(stage[0])
+            else:
+                futures = [
+                    self.executor.submit(self.run_system, system)
+                    for system in stage
+                ]
+                for future in futures:
+                    future.result()
+            # Apply structural changes requested by systems
+            if self.commands:
+                self.commands.flush()
+
+        # Change run_state AFTER running all systems
+        if self.next_run_state:
+            self.run_state = self.next_run_state
+            self.next_run_state = None
+            log.debug(f'systems.run({self.run_state.name}): {self.stages[self.run_state]}')
+
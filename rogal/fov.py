@@ -0,0 +1,281 @@
+import collections
+import concurrent.futures
+import functools
+import logging
+
+import numpy as np
+
+import tcod
+import tcod.map
+
+from .geometry import Position
+
+
+log = logging.getLogger(__name__)
+
+
+"""Field of view calculations."""
+
+
+def compute_tcod_fov(algorithm, transparency, pov, radius):
+    return tcod.map.compute_fov(
+        transparency=transparency,
+        pov=pov,
+        radius=radius,
+        light_walls=True,
+        algorithm=algorithm,
+    )
+
+
+# (row dx, row dy, column dx, column dy) of each quadrant: north, south, east, west
+QUADRANTS = [
+    (0, -1, 1, 0),
+    (0, 1, 1, 0),
+    (1, 0, 0, 1),
+    (-1, 0, 0, 1),
+]
+
+
+def compute_symmetric_shadowcast(transparency, pov, radius):
+    """Symmetric shadowcasting, with whole rows processed at once.
+
+    See: https://www.albertford.com/shadowcasting/
+
+    Slopes are kept as (numerator, denominator) pairs, so rounding of ties is exact.
+    Positions outside of transparency array are treated as not visible walls.
+
+    NOTE: Follows reference implementation, which reveals slightly less walls than
+          tcod.FOV_SYMMETRIC_SHADOWCAST
+
+    """
+    width, height = transparency.shape
+    fov = np.zeros((width, height), dtype=bool)
+    x, y = pov
+    fov[x, y] = True
+    max_depth = radius or max(width, height)
+
+    for row_dx, row_dy, col_dx, col_dy in QUADRANTS:
+        # Rows to scan: (depth, start slope, end slope)
+        rows = [(1, (-1, 1), (1, 1)), ]
+        while rows:
+            depth, (start_num, start_den), (end_num, end_den) = rows.pop()
+            if depth > max_depth:
+                continue
+            # Round ties up for min_col, round ties down for max_col
+            min_col = (2*depth*start_num + start_den) // (2*start_den)
+            max_col = -((end_den - 2*depth*end_num) // (2*end_den))
+            if min_col > max_col:
+                continue
+
+            cols = np.arange(min_col, max_col+1)
+            xs = x + depth*row_dx + cols*col_dx
+            ys = y + depth*row_dy + cols*col_dy
+            inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            walls = np.ones(cols.shape, dtype=bool)
+            walls[inside] = ~transparency[xs[inside], ys[inside]]
+
+            symmetric = (cols*start_den >= depth*start_num) & (cols*end_den <= depth*end_num)
+            visible = (walls | symmetric) & inside
+            fov[xs[visible], ys[visible]] = True
+
+            # Continue scanning next row for each run of floor tiles
+            edges = np.diff(np.concatenate([[False], ~walls, [False]]).astype(np.int8))
+            for run_start, run_end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+                start_slope = (start_num, start_den)
+                if run_start > 0:
+                    start_slope = (2*int(cols[run_start])-1, 2*depth)
+                end_slope = (end_num, end_den)
+                if run_end < len(cols):
+                    end_slope = (2*int(cols[run_end])-1, 2*depth)
+                rows.append((depth+1, start_slope, end_slope))
+
+    if radius:
+        dx = np.arange(width)[:, np.newaxis] - x
+        dy = np.arange(height)[np.newaxis, :] - y
+        # NOTE: Same as in tcod, positions at exactly radius distance are not included
+        fov &= dx*dx + dy*dy < radius*radius
+    return fov
+
+
+ALGORITHMS = {
+    'basic': functools.partial(compute_tcod_fov, tcod.FOV_BASIC),
+    'diamond': functools.partial(compute_tcod_fov, tcod.FOV_DIAMOND),
+    'shadow': functools.partial(compute_tcod_fov, tcod.FOV_SHADOW),
+    'restrictive': functools.partial(compute_tcod_fov, tcod.FOV_RESTRICTIVE),
+    'permissive': functools.partial(compute_tcod_fov, tcod.FOV_PERMISSIVE(1)),
+    'symmetric': functools.partial(compute_tcod_fov, tcod.FOV_SYMMETRIC_SHADOWCAST),
+    'numpy_symmetric': compute_symmetric_shadowcast,
+}
+
+DEFAULT_ALGORITHM = 'restrictive'
+
+
+def fov_window(size, position, radius):
+    """Return (x1, y1, x2, y2) window of given radius around position, clipped to size."""
+    width, height = size
+    if not radius:
+        # NOTE: radius=0 means unlimited view range
+        return 0, 0, width, height
+    return (
+        max(position.x-radius, 0), max(position.y-radius, 0),
+        min(position.x+radius+1, width), min(position.y+radius+1, height),
+    )
+
+
+def compute_fov(transparency, position, radius, algorithm=DEFAULT_ALGORITHM):
+    """Return fov calculated on window around position, and offset of this window."""
+    x1, y1, x2, y2 = fov_window(transparency.shape, position, radius)
+    fov = ALGORITHMS[algorithm](
+        transparency[x1:x2, y1:y2],
+        (position.x-x1, position.y-y1),
+        radius,
+    )
+    return fov, Position(x1, y1)
+
+
+class FOVCache:
+
+    """LRU cache of calculated (fov, offset) results, limited by number of bytes used.
+
+    Cached fov arrays are shared between viewers, so they are made read-only.
+
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    @staticmethod
+    def entry_nbytes(key, fov):
+        return fov.nbytes + len(key[-1])
+
+    def get(self, key):
+        """Return cached (fov, offset) for given key, or None."""
+        fov_offset = self._entries.get(key)
+        if fov_offset is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return fov_offset
+
+    def put(self, key, fov_offset):
+        fov, offset = fov_offset
+        fov.flags.writeable = False
+        if key in self._entries:
+            return
+        self._entries[key] = fov_offset
+        self.nbytes += self.entry_nbytes(key, fov)
+        while self.nbytes > self.max_bytes and self._entries:
+            key, (fov, offset) = self._entries.popitem(last=False)
+            self.nbytes -= self.entry_nbytes(key, fov)
+
+    @property
+    def hit_ratio(self):
+        calls = self.hits + self.misses
+        return calls and self.hits / calls
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FOVCalculator:
+
+    """Calculates field of view of many viewers on the same level at once.
+
+    With max_workers set, big batches are split between threads of a thread pool
+    (both tcod and NumPy release GIL while calculating). Otherwise all calculations
+    are run on calling thread.
+
+    With cache_size set, results are cached in FOVCache (of given size in bytes), keyed by
+    level_id, position, radius, algorithm and state of transparency inside FOV window.
+
+    """
+
+    # Batches smaller than that are not worth splitting between threads
+    MIN_PARALLEL = 8
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, max_workers=None, cache_size=None):
+        if not algorithm in ALGORITHMS:
+            raise ValueError(f'Unknown FOV algorithm: {algorithm!r}')
+        self.algorithm = algorithm
+        self.max_workers = max_workers
+        self.executor = None
+        if max_workers:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix='fov',
+            )
+        self.cache = None
+        if cache_size:
+            self.cache = FOVCache(cache_size)
+
+    def compute(self, transparency, position, radius):
+        """Return (fov, offset) for single viewer."""
+        return compute_fov(transparency, position, radius, self.algorithm)
+
+    def compute_batch(self, transparency, viewers):
+        return [
+            self.compute(transparency, position, radius)
+            for position, radius in viewers
+        ]
+
+    def cache_key(self, level_id, transparency, position, radius):
+        # NOTE: Only transparency inside FOV window matters, so changes elsewhere on the level,
+        #       or reverted changes (like door opened and closed again) are still cache hits
+        x1, y1, x2, y2 = fov_window(transparency.shape, position, radius)
+        window = np.packbits(transparency[x1:x2, y1:y2]).tobytes()
+        return (level_id, position, radius, self.algorithm, window)
+
+    def compute_uncached(self, transparency, viewers):
+        if self.executor is None or len(viewers) < self.MIN_PARALLEL:
+            return self.compute_batch(transparency, viewers)
+
+        batch_size = -(-len(viewers) // self.max_workers)
+        batches = [
+            viewers[start:start+batch_size]
+            for start in range(0, len(viewers), batch_size)
+        ]
+        results = []
+        for batch_results in self.executor.map(
+            functools.partial(self.compute_batch, transparency), batches
+        ):
+            results.extend(batch_results)
+        return results
+
+    def compute_many(self, transparency, viewers, level_id=None):
+        """Return list of (fov, offset) for each of (position, radius) viewers."""
+        viewers = list(viewers)
+        if self.cache is None:
+            return self.compute_uncached(transparency, viewers)
+
+        results = []
+        missed = {}
+        for position, radius in viewers:
+            key = self.cache_key(level_id, transparency, position, radius)
+            fov_offset = self.cache.get(key)
+            if fov_offset is None:
+                missed.setdefault(key, (position, radius))
+            results.append((key, fov_offset))
+
+        if missed:
+            computed = dict(zip(
+                missed.keys(),
+                self.compute_uncached(transparency, list(missed.values())),
+            ))
+            for key, fov_offset in computed.items():
+                self.cache.put(key, fov_offset)
+            results = [
+                (key, fov_offset or computed[key])
+                for key, fov_offset in results
+            ]
+
+        return [fov_offset for key, fov_offset in results]
+
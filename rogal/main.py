@@ -16,6 +16,8 @@ from .procgen.dungeons import StaticLevel
 
 from .ecs import ECS
 
+from .utils import perf
+
 from .toolkit.builder import WidgetsBuilder
 
 from .events.managers import EventsManager
@@ -28,6 +30,9 @@ from .data.loaders import DataLoader
 from .tiles.tilesets import Tileset
 
 from .spatial.spatial_index import SpatialIndex
+from .spatial.buckets import BucketsIndex
+from .fov import FOVCalculator
+from .actions_queue import ActionsQueue
 
 from . import events
 from . import signals
@@ -64,6 +69,27 @@ SEED = None
 SEED = uuid.UUID('5829028d-61c1-4e8d-ac96-26236d1fd6a1')
 
 
+# Number of levels with cached flags and masks, None to keep caches of all visited levels
+CACHED_LEVELS = 8
+
+
+# FOV algorithm, see: fov.ALGORITHMS
+FOV_ALGORITHM = 'restrictive'
+# Number of threads used to calculate FOV of many viewers at once, None to calculate on main thread
+FOV_WORKERS = None
+# Max number of bytes used by cached FOV results, None to disable caching
+FOV_CACHE_SIZE = 4*1024*1024
+
+
+# Number of threads used to run independent systems in parallel, None to run sequentially
+SYSTEMS_WORKERS = None
+
+# Number of last frames recorded by perf.Tracer, None to disable tracing
+TRACE_FRAMES = None
+# Dump trace when frame takes longer than given number of seconds
+TRACE_SLOW_FRAME = 0.1
+
+
 WRAPPERS = {
     'tcod': TcodWrapper,
     'curses': CursesWrapper,
@@ -127,15 +153,28 @@ def initialize_ui(ecs, inital_screen):
     ecs.resources.ui_manager.create(inital_screen)
 
 
-def initialize_game(ecs, seed):
+def initialize_game(ecs, seed, level_generator_cls=None, fov_algorithm=None, fov_workers=None):
     # Spatial index
-    ecs.resources.spatial = SpatialIndex(ecs)
+    ecs.resources.spatial = SpatialIndex(ecs, cached_levels=CACHED_LEVELS)
+
+    # Field of view
+    ecs.resources.fov = FOVCalculator(
+        fov_algorithm or FOV_ALGORITHM,
+        max_workers=fov_workers or FOV_WORKERS,
+        cache_size=FOV_CACHE_SIZE,
+    )
+    # Windows of viewsheds, for invalidating only viewsheds affected by BlocksVision changes
+    ecs.resources.viewsheds_index = BucketsIndex()
+
+    # Actions queue
+    ecs.resources.actions_queue = ActionsQueue(ecs)
 
     # Entities spawner initialization
     ecs.resources.spawner = EntitiesSpawner(ecs, DataLoader(ENTITIES_DATA_FN))
 
     # Level generator
-    ecs.resources.level_generator = LEVEL_GENERATOR_CLS(seed, ecs, LEVEL_SIZE)
+    level_generator_cls = level_generator_cls or LEVEL_GENERATOR_CLS
+    ecs.resources.level_generator = level_generator_cls(seed, ecs, LEVEL_SIZE)
 
     # Create player
     player = ecs.resources.spawner.create('actors.PLAYER')
@@ -169,6 +208,7 @@ def initialize_game(ecs, seed):
         systems.actions.OperateSystem(ecs),
 
         systems.spatial.SpatialIndexingSystem(ecs),
+        systems.actions.DormancySystem(ecs),
 
         systems.awerness.InvalidateViewshedsSystem(ecs),
         systems.awerness.VisibilitySystem(ecs),
@@ -177,14 +217,19 @@ def initialize_game(ecs, seed):
         systems.actions.ActionsPerformedSystem(ecs),
     )
 
+    return player
+
 
 def run(wrapper):
     # Generate seed and init RNG
     seed = SEED or generate_seed()
     rng.seed(seed, dump='rng')
 
+    if TRACE_FRAMES:
+        perf.Tracer.enable(max_frames=TRACE_FRAMES, slow_frame=TRACE_SLOW_FRAME)
+
     # ECS initialization
-    ecs = ECS()
+    ecs = ECS(max_workers=SYSTEMS_WORKERS)
 
     initialize_wrapper(ecs, wrapper)
     initialize_ui(ecs, 'IN_GAME')
@@ -25,7 +25,7 @@ class TerrainGenerator(Generator):
 
     def fill_default(self, terrain):
         """Fill whole area with given terrain."""
-        terrain[:] = self.spawner.get(self.default_fill)
+        terrain.fill(self.spawner.get(self.default_fill))
 
     def dig_rooms(self, terrain, rooms):
         """Dig rooms."""
@@ -99,9 +99,8 @@ class Camera(WithPositionMixin, core.WithSize, core.Renderer):
             coverage.y : coverage.y2
         ]
 
-    def walls_bitmask(self, level_id, coverage, revealed, terrain_type):
-        walls_mask = self.spatial.terrain_type(level_id, terrain_type)
-        walls_mask = self.get_covered(walls_mask, coverage)
+    def walls_bitmask(self, terrain, revealed, terrain_type):
+        walls_mask = terrain >> 4 == terrain_type
         # NOTE: We don't want bitmasking to spoil not revealed terrain!
         return bitmask_walls(walls_mask, revealed)
 
@@ -163,7 +162,7 @@ class Camera(WithPositionMixin, core.WithSize, core.Renderer):
         """Draw TERRAIN tiles."""
 
         # Bitshift masking for terrain.Type.WALL terrain
-        walls_mask = self.walls_bitmask(level_id, coverage, revealed, self.walls_terrain_type)
+        walls_mask = self.walls_bitmask(terrain, revealed, self.walls_terrain_type)
 
         # Offset for drawing a terrain tile with a mask
         # It's mirrored camera.position but only with x,y values > 0
@@ -200,18 +199,13 @@ class Camera(WithPositionMixin, core.WithSize, core.Renderer):
 
     def draw_entities(self, panel, level_id, coverage, revealed, visible):
         """Draw all renderable ENTITIES, in order described by Renderable.render_order."""
-        renderables = self.ecs.manage(components.Renderable)
-        locations = self.ecs.manage(components.Location)
+        renderables = self.ecs.query(components.Renderable, components.Location)
 
-        entities = self.spatial.entities(level_id)
-        for renderable, entity, location in sorted(
-            self.ecs.join(renderables, entities, locations),
-            key=itemgetter(0)
+        entities = self.spatial.query_rect(level_id, coverage)
+        for entity, renderable, location in sorted(
+            renderables.filter(entities),
+            key=itemgetter(1)
         ):
-            if not location.position in coverage:
-                # Not inside area covered by camera, skip!
-                continue
-
             tile = None
             position = location.position.offset(coverage)
             if visible[position]:
@@ -239,21 +233,18 @@ class Camera(WithPositionMixin, core.WithSize, core.Renderer):
         return seen
 
     def render(self, panel, timestamp, actor=None, location=None):
-        fov = None
+        viewshed = None
         actor = actor or self.ecs.resources.current_player
         if actor:
             locations = self.ecs.manage(components.Location)
             viewsheds = self.ecs.manage(components.Viewshed)
             location = locations.get(actor)
-            fov = viewsheds.get(actor).fov
+            viewshed = viewsheds.get(actor)
         if not location:
             return
         position = location.position
         level = self.spatial.get_level(location.level_id)
 
-        if fov is None:
-            fov = np.ones(level.size, dtype=np.bool)
-
         seen = self.get_seen(actor, location)
 
         self.update_cam_area(panel, level, position)
@@ -266,7 +257,10 @@ class Camera(WithPositionMixin, core.WithSize, core.Renderer):
         # Calculate visibility masks
         # TODO: Fails on level change (seen is None)!
         revealed = self.get_covered(seen, coverage)
-        visible = self.get_covered(fov, coverage)
+        if viewshed is None or viewshed.fov is None:
+            visible = np.ones(coverage.size, dtype=bool)
+        else:
+            visible = viewshed.covered(coverage)
 
         terrain = self.get_covered(level.terrain, coverage)
 
@@ -0,0 +1,92 @@
+import collections
+import logging
+
+import numpy as np
+
+from ..ecs import EntitiesSet
+
+
+log = logging.getLogger(__name__)
+
+
+BUCKET_SIZE = 16
+
+
+class BucketsIndex:
+
+    """Index of entities rectangular areas (like bounding boxes of viewsheds) on each Level.
+
+    Level is divided into square buckets of bucket_size, each entity is stored in all buckets
+    intersecting its area. Querying positions only checks entities from buckets of these
+    positions, so it scales with number of entities nearby, not all entities on all levels.
+
+    """
+
+    def __init__(self, bucket_size=BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        # entity -> (level_id, x1, y1, x2, y2)
+        self._areas = {}
+        # level_id -> bucket -> entities
+        self._buckets = collections.defaultdict(dict)
+
+    def iter_buckets(self, x1, y1, x2, y2):
+        """Yield keys of buckets intersecting given area."""
+        size = self.bucket_size
+        for bucket_x in range(x1 // size, (x2-1) // size + 1):
+            for bucket_y in range(y1 // size, (y2-1) // size + 1):
+                yield (bucket_x, bucket_y)
+
+    def update(self, entity, level_id, x1, y1, x2, y2):
+        """Set area (x2, y2 excluded) of given entity."""
+        area = (level_id, x1, y1, x2, y2)
+        prev_area = self._areas.get(entity)
+        if prev_area == area:
+            return
+        if prev_area is not None:
+            self.remove(entity)
+        self._areas[entity] = area
+        buckets = self._buckets[level_id]
+        for bucket in self.iter_buckets(x1, y1, x2, y2):
+            buckets.setdefault(bucket, EntitiesSet()).add(entity)
+
+    def remove(self, entity):
+        area = self._areas.pop(entity, None)
+        if area is None:
+            return
+        level_id, x1, y1, x2, y2 = area
+        buckets = self._buckets[level_id]
+        for bucket in self.iter_buckets(x1, y1, x2, y2):
+            entities = buckets.get(bucket)
+            if entities is None:
+                continue
+            entities.discard(entity)
+            if not entities:
+                del buckets[bucket]
+        if not buckets:
+            del self._buckets[level_id]
+
+    def query(self, level_id, index):
+        """Return entities with area containing any of positions from (xs, ys) index."""
+        xs, ys = index
+        buckets = self._buckets.get(level_id)
+        if not buckets or not len(xs):
+            return EntitiesSet()
+
+        size = self.bucket_size
+        candidates = EntitiesSet()
+        for bucket in set(zip((xs // size).tolist(), (ys // size).tolist())):
+            candidates.update(buckets.get(bucket, ()))
+
+        entities = EntitiesSet()
+        for entity in candidates:
+            level_id, x1, y1, x2, y2 = self._areas[entity]
+            if np.any((xs >= x1) & (xs < x2) & (ys >= y1) & (ys < y2)):
+                entities.add(entity)
+        return entities
+
+    def __contains__(self, entity):
+        return entity in self._areas
+
+    def __len__(self):
+        return len(self._areas)
+
@@ -0,0 +1,155 @@
+import logging
+
+import numpy as np
+
+from .. import dtypes
+from ..ecs import EntitiesSet
+from ..ecs.core import Entity
+
+
+log = logging.getLogger(__name__)
+
+
+class OccupancyGrid:
+
+    """Array backed index of entities on each position of a Level.
+
+    Stores number of entities on each position, and ID of entity on positions with
+    single entity. Entities on positions occupied by more than one entity are stored
+    in small overflow dict.
+
+    NOTE: Only compact Entity IDs (fitting in ENTITY_DT) can be placed on a grid
+
+    """
+
+    __slots__ = ('counts', 'entities', 'overflow', )
+
+    def __init__(self, size):
+        self.counts = np.zeros(size, dtype=np.uint16)
+        self.entities = np.zeros(size, dtype=dtypes.ENTITY_DT)
+        self.overflow = {}
+
+    @property
+    def size(self):
+        return self.counts.shape
+
+    def is_inside(self, position):
+        """Return True if given position is inside grid bounds."""
+        width, height = self.size
+        return 0 <= position.x < width and 0 <= position.y < height
+
+    def get(self, position):
+        """Return new EntitiesSet of entities on given position, empty outside of the grid."""
+        if not self.is_inside(position):
+            return EntitiesSet()
+        count = self.counts[position]
+        if count == 0:
+            return EntitiesSet()
+        if count == 1:
+            return EntitiesSet([Entity(int(self.entities[position])), ])
+        return EntitiesSet(self.overflow[position])
+
+    def count(self, position):
+        if not self.is_inside(position):
+            return 0
+        return int(self.counts[position])
+
+    def add(self, entity, position):
+        """Add entity on given position."""
+        if not entity.is_compact:
+            raise ValueError(f'Only compact entity IDs can be placed on grid: {entity!r}')
+        count = self.counts[position]
+        if count == 0:
+            self.entities[position] = entity
+        elif count == 1:
+            single = Entity(int(self.entities[position]))
+            if single == entity:
+                return
+            self.overflow[position] = EntitiesSet([single, entity])
+            self.entities[position] = 0
+        else:
+            entities = self.overflow[position]
+            if entity in entities:
+                return
+            entities.add(entity)
+        self.counts[position] = count + 1
+
+    def discard(self, entity, position):
+        """Remove entity from given position."""
+        count = self.counts[position]
+        if count == 0:
+            return
+        if count == 1:
+            if self.entities[position] != entity:
+                return
+            self.entities[position] = 0
+        else:
+            entities = self.overflow[position]
+            if not entity in entities:
+                return
+            entities.discard(entity)
+            if count == 2:
+                # Back to single entity
+                self.entities[position] = entities.pop()
+                del self.overflow[position]
+        self.counts[position] = count - 1
+
+    def query_region(self, x1, y1, x2, y2, mask=None):
+        """Return array of entities inside given region, clipped to grid bounds.
+
+        If mask is given (with shape of region) only positions where mask is True are included.
+
+        """
+        width, height = self.size
+        clipped_x1, clipped_y1 = max(x1, 0), max(y1, 0)
+        clipped_x2, clipped_y2 = min(x2, width), min(y2, height)
+        if clipped_x1 >= clipped_x2 or clipped_y1 >= clipped_y2:
+            return np.empty(0, dtype=dtypes.ENTITY_DT)
+        if mask is not None:
+            mask = mask[clipped_x1-x1:clipped_x2-x1, clipped_y1-y1:clipped_y2-y1]
+        x1, y1, x2, y2 = clipped_x1, clipped_y1, clipped_x2, clipped_y2
+
+        singles_mask = self.counts[x1:x2, y1:y2] == 1
+        if mask is not None:
+            singles_mask &= mask
+        singles = self.entities[x1:x2, y1:y2][singles_mask]
+        overflow = [
+            entity
+            for (x, y), entities in self.overflow.items()
+            if x1 <= x < x2 and y1 <= y < y2 and (mask is None or mask[x-x1, y-y1])
+            for entity in entities
+        ]
+        if not overflow:
+            return singles
+        return np.concatenate([singles, np.array(overflow, dtype=dtypes.ENTITY_DT)])
+
+    def query_mask(self, mask, offset=None):
+        """Return array of entities on positions where mask is True.
+
+        Mask might cover only part of the grid, with top-left corner at given offset.
+
+        """
+        x, y = offset or (0, 0)
+        width, height = mask.shape
+        return self.query_region(x, y, x+width, y+height, mask)
+
+    def query_rect(self, rect):
+        """Return array of entities inside given Rectangle."""
+        return self.query_region(rect.x, rect.y, rect.x2, rect.y2)
+
+    def query_radius(self, position, radius):
+        """Return array of entities within given (euclidean) radius from position."""
+        x, y = position
+        dx = np.arange(-radius, radius+1)
+        mask = dx[:, np.newaxis]**2 + dx[np.newaxis, :]**2 <= radius**2
+        return self.query_region(x-radius, y-radius, x+radius+1, y+radius+1, mask)
+
+    def clear(self):
+        self.counts[:] = 0
+        self.entities[:] = 0
+        self.overflow.clear()
+
+    @property
+    def nbytes(self):
+        return self.counts.nbytes + self.entities.nbytes
+
@@ -4,43 +4,99 @@ import logging
 import numpy as np
 
 from ..bitmask import bitmask_8bit
+from ..collections.chunked_array import ChunkedArray, map_chunks
 from .. import components
 from .. import dtypes
 from ..ecs import EntitiesSet
+from ..ecs.core import Entity
 from ..flags import Flag
 from ..geometry import Direction
 
+from .occupancy import OccupancyGrid
+
 
 log = logging.getLogger(__name__)
 
 
+# Bit of 8-bit neighbours bitmask (see bitmask.bitmask_8bit) for each Direction
+EXITS_BITS = {
+    Direction.N: 0,
+    Direction.S: 1,
+    Direction.W: 2,
+    Direction.E: 3,
+    Direction.NW: 4,
+    Direction.SE: 5,
+    Direction.SW: 6,
+    Direction.NE: 7,
+}
+
+# Exits bitmask -> frozenset of Directions
+EXITS_LOOKUP = [
+    frozenset(direction for direction, bit in EXITS_BITS.items() if exits_bitmask & 1 << bit)
+    for exits_bitmask in range(256)
+]
+
+
 class SpatialIndex:
 
-    """Spatial index - central API for level related indexes (flags and entities)."""
+    """Spatial index - central API for level related indexes (flags and entities).
+
+    Level's terrain, flags and masks are stored in ChunkedArrays, so only chunks with something
+    else than default fill_value (like solid rock) are allocated, and calculated.
+
+    Derived caches (flags, masks, exits bitmasks, occupancy grids) are calculated on demand. When cached_levels
+    is set, caches of least recently used levels above that limit are dropped, and rebuilt
+    when level is accessed again.
+
+    """
 
-    def __init__(self, ecs):
+    def __init__(self, ecs, cached_levels=None):
         self.ecs = ecs
         self.levels = self.ecs.manage(components.Level)
+        self.cached_levels = cached_levels
 
         # flags.Flags bitmasks calculated from level's terrain
         self._terrain_flags = {}
         # flags.Flags bitmasks calculated from entities
         self._entities_flags = {}
         # all entites per level
-        self._entities = collections.defaultdict(EntitiesSet)
-        # all entities per position per level
-        self._entities_positions = collections.defaultdict(lambda: collections.defaultdict(EntitiesSet))
+        self._entities = {}
+        # all entities per position per level, rebuilt from Locations when needed
+        self._grids = {}
+
+        # Cached boolean masks, updated in place
+        self._masks = {
+            'transparent': {},
+            'walkable': {},
+        }
+        # (level_id, mask_name) -> version, incremented on each change of mask
+        self._versions = collections.Counter()
+        # level_id -> (transparent version, revealable mask)
+        self._revealable = {}
+        # 8-bit bitmasks of walkable neighbours
+        self._exits = {}
+
+        # level_id -> None, ordered from least to most recently used
+        self._recently_used = collections.OrderedDict()
 
     @staticmethod
     def init_flags(size):
         """Init flags array."""
-        flags = np.zeros(size, dtype=dtypes.FLAGS_DT)
+        flags = ChunkedArray(size, dtype=dtypes.FLAGS_DT, fill_value=0)
         return flags
 
+    @staticmethod
+    def positions_index(positions):
+        """Return tuple of (x, y) index arrays for given positions."""
+        if not positions:
+            return (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+        xs, ys = np.array(list(positions), dtype=np.intp).T
+        return (xs, ys)
+
     @staticmethod
     def init_terrain(size):
         """Init terrain tiles array."""
-        terrain = np.zeros(size, dtype=dtypes.TERRAIN_DT)
+        terrain = ChunkedArray(size, dtype=dtypes.TERRAIN_DT, fill_value=0)
         return terrain
 
     def create_level(self, level_id, depth, terrain):
@@ -52,12 +108,73 @@ class SpatialIndex:
         """Get Level with given ID."""
         return self.levels.get(level_id)
 
-    # TODO: destroy_level(self, level_id):
+    def touch_level(self, level_id):
+        """Mark level as most recently used, unload caches of least recently used levels."""
+        recently_used = self._recently_used
+        if level_id in recently_used:
+            recently_used.move_to_end(level_id)
+            return
+        recently_used[level_id] = None
+        if self.cached_levels is None:
+            return
+        while len(recently_used) > self.cached_levels:
+            cold_level_id, _ = recently_used.popitem(last=False)
+            self.unload_level(cold_level_id)
+
+    def cached_nbytes(self, level_id):
+        """Return number of bytes used by derived caches of given Level."""
+        nbytes = 0
+        for cache in [self._terrain_flags, self._entities_flags, self._exits, *self._masks.values()]:
+            array = cache.get(level_id)
+            if array is not None:
+                nbytes += array.nbytes
+        version, revealable = self._revealable.get(level_id, (None, None))
+        if revealable is not None:
+            nbytes += revealable.nbytes
+        grid = self._grids.get(level_id)
+        if grid is not None:
+            nbytes += grid.nbytes
+        return nbytes
+
+    def unload_level(self, level_id):
+        """Drop derived caches of given Level, return number of bytes reclaimed.
+
+        Caches are rebuilt on demand, from level's terrain and entities.
+
+        """
+        nbytes = self.cached_nbytes(level_id)
+        for cache in [self._terrain_flags, self._entities_flags, self._exits, *self._masks.values()]:
+            cache.pop(level_id, None)
+        self._grids.pop(level_id, None)
+        self._revealable.pop(level_id, None)
+        self._recently_used.pop(level_id, None)
+        log.debug(f'SpatialIndex.unload_level(level_id={level_id.short_id!r}) - {nbytes} bytes reclaimed')
+        return nbytes
+
+    def destroy_level(self, level_id):
+        """Remove Level, all entities on it, and its indexes, return number of bytes reclaimed."""
+        nbytes = self.unload_level(level_id)
+        level = self.get_level(level_id)
+        if level is not None:
+            nbytes += level.terrain.nbytes
+
+        level_memories = self.ecs.manage(components.LevelMemory)
+        # NOTE: Shared LevelMemory might be used by many entities
+        for memory in {id(memory): memory for memory in level_memories.values()}.values():
+            nbytes += memory.forget(level_id)
+
+        entities = self._entities.pop(level_id, EntitiesSet())
+        self.ecs.remove(level_id, *entities)
+        for mask_name in self._masks:
+            self._versions.pop((level_id, mask_name), None)
+
+        log.info(f'Destroyed level: {level_id.short_id!r} - {nbytes} bytes reclaimed')
+        return nbytes
 
     def terrain_type(self, level_id, terrain_type):
         """Return boolean mask of tiles with given terrain Type."""
         level = self.get_level(level_id)
-        return level.terrain >> 4 == terrain_type
+        return map_chunks(lambda terrain: terrain >> 4 == terrain_type, level.terrain, dtype=bool)
 
     def calculate_terrain_flags(self, level_id):
         """Calculated flags based on level's terrain tiles."""
@@ -66,16 +183,28 @@ class SpatialIndex:
         blocks_movement = self.ecs.manage(components.BlocksMovement)
 
         level = self.get_level(level_id)
-        terrain_flags = self.init_flags(level.size)
-        for terrain in np.unique(level.terrain):
-            terrain_mask = level.terrain == terrain
-            flags = blocks_vision.get(terrain, 0) | blocks_movement.get(terrain, 0)
-            terrain_flags[terrain_mask] = flags
+        terrain_flags = np.zeros(np.iinfo(dtypes.TERRAIN_DT).max+1, dtype=dtypes.FLAGS_DT)
+        for terrain in range(len(terrain_flags)):
+            terrain_flags[terrain] = blocks_vision.get(terrain, 0) | blocks_movement.get(terrain, 0)
 
-        return terrain_flags
+        return map_chunks(terrain_flags.take, level.terrain, dtype=dtypes.FLAGS_DT)
+
+    def set_terrain(self, level_id, positions, terrain):
+        """Change terrain on given positions, and update terrain flags and masks."""
+        blocks_vision = self.ecs.manage(components.BlocksVision)
+        blocks_movement = self.ecs.manage(components.BlocksMovement)
+
+        level = self.get_level(level_id)
+        index = self.positions_index(positions)
+        level.terrain[index] = terrain
+        terrain_flags = self._terrain_flags.get(level_id)
+        if terrain_flags is not None:
+            terrain_flags[index] = blocks_vision.get(terrain, 0) | blocks_movement.get(terrain, 0)
+        self.update_masks(level_id, index)
 
     def terrain_flags(self, level_id):
         """Return terrain flags for given Level."""
+        self.touch_level(level_id)
         terrain_flags = self._terrain_flags.get(level_id)
         if terrain_flags is None:
             terrain_flags = self.calculate_terrain_flags(level_id)
@@ -87,16 +216,67 @@ class SpatialIndex:
         log.debug(f'SpatialIndex.calculate_entities()')
         locations = self.ecs.manage(components.Location)
         for entity, location in locations:
-            self._entities[location.level_id].add(entity)
-            self._entities_positions[location.level_id][location.position].add(entity)
+            self._entities.setdefault(location.level_id, EntitiesSet()).add(entity)
+            self.grid(location.level_id).add(entity, location.position)
 
     def entities(self, level_id):
         """Get all entities on given Level."""
-        return self._entities[level_id]
+        return self._entities.get(level_id) or EntitiesSet()
+
+    def calculate_grid(self, level_id):
+        """Calculate OccupancyGrid of given Level, from Locations of its entities."""
+        log.debug(f'SpatialIndex.calculate_grid(level_id={level_id.short_id!r})')
+        locations = self.ecs.manage(components.Location)
+        level = self.get_level(level_id)
+        grid = OccupancyGrid(level.size)
+        for entity, location in self.ecs.join(self.entities(level_id), locations):
+            if location.level_id == level_id:
+                grid.add(entity, location.position)
+        return grid
+
+    def grid(self, level_id):
+        """Return OccupancyGrid of given Level."""
+        self.touch_level(level_id)
+        grid = self._grids.get(level_id)
+        if grid is None:
+            grid = self.calculate_grid(level_id)
+            self._grids[level_id] = grid
+        return grid
 
     def get_entities(self, location, position=None):
         """Get entitities on given Location."""
-        return self._entities_positions[location.level_id][position or location.position]
+        return self.grid(location.level_id).get(position or location.position)
+
+    @staticmethod
+    def to_entities(entities_array):
+        """Return EntitiesSet of entities from array of entity IDs."""
+        return EntitiesSet(map(Entity, entities_array.tolist()))
+
+    def query_mask(self, level_id, mask, offset=None):
+        """Return entities on positions where mask (with top-left corner at offset) is True."""
+        return self.to_entities(self.grid(level_id).query_mask(mask, offset))
+
+    def query_rect(self, level_id, rect):
+        """Return entities inside given Rectangle."""
+        return self.to_entities(self.grid(level_id).query_rect(rect))
+
+    def query_radius(self, level_id, position, radius):
+        """Return entities within given radius from position."""
+        return self.to_entities(self.grid(level_id).query_radius(position, radius))
+
+    def gather_entities_flags(self, entities):
+        """Return index arrays of positions and array of flags of given entities."""
+        blocks_vision = self.ecs.manage(components.BlocksVision)
+        blocks_movement = self.ecs.manage(components.BlocksMovement)
+        locations = self.ecs.manage(components.Location)
+
+        positions = []
+        flags = []
+        for manager in [blocks_vision, blocks_movement]:
+            for entity, flag, location in self.ecs.join(entities, manager, locations):
+                positions.append(location.position)
+                flags.append(int(flag))
+        return self.positions_index(positions), np.array(flags, dtype=dtypes.FLAGS_DT)
 
     def calculate_entities_flags(self, level_id):
         """Calculate entities flags for given Level."""
@@ -109,82 +289,183 @@ class SpatialIndex:
         if not (blocks_vision or blocks_movement):
             return entities_flags
 
-        locations = self.ecs.manage(components.Location)
-        for entity, flag, location in self.ecs.join(self.entities(level_id), blocks_vision, locations):
-            entities_flags[location.position] |= flag
-        for entity, flag, location in self.ecs.join(self.entities(level_id), blocks_movement, locations):
-            entities_flags[location.position] |= flag
+        # NOTE: Multiple entities might be on the same position, so or_at is used
+        positions, flags = self.gather_entities_flags(self.entities(level_id))
+        entities_flags.or_at(positions, flags)
 
         return entities_flags
 
     def entities_flags(self, level_id):
         """Return entities flags for given Level."""
+        self.touch_level(level_id)
         entities_flags = self._entities_flags.get(level_id)
         if entities_flags is None:
             entities_flags = self.calculate_entities_flags(level_id)
             self._entities_flags[level_id] = entities_flags
         return entities_flags
 
-    def calculate_entities_flags_position(self, level_id, position):
-        """Calculate flags for entities on given Location."""
-        blocks_vision = self.ecs.manage(components.BlocksVision)
-        blocks_movement = self.ecs.manage(components.BlocksMovement)
-        flags = 0
-        for entity in self._entities_positions[level_id][position]:
-            flags |= blocks_vision.get(entity, 0) | blocks_movement.get(entity, 0)
-        self.entities_flags(level_id)[position] = flags
+    def calculate_entities_flags_positions(self, level_id, positions):
+        """Recalculate flags for entities on given positions."""
+        entities_flags = self.entities_flags(level_id)
+        grid = self.grid(level_id)
+        entities = EntitiesSet()
+        for position in positions:
+            entities.update(grid.get(position))
 
-    def transparent(self, level_id):
-        """Return boolean mask of transparent tiles."""
+        index = self.positions_index(positions)
+        entities_flags[index] = 0
+        positions, flags = self.gather_entities_flags(entities)
+        entities_flags.or_at(positions, flags)
+
+        self.update_masks(level_id, index)
+
+    MASKS_FLAGS = {
+        'transparent': Flag.BLOCKS_VISION,
+        'walkable': Flag.BLOCKS_MOVEMENT,
+    }
+
+    def calculate_mask(self, level_id, mask_name):
+        """Calculate boolean mask of tiles without given mask's blocking flag."""
         terrain_flags = self.terrain_flags(level_id)
         entities_flags = self.entities_flags(level_id)
-        return (terrain_flags | entities_flags) & Flag.BLOCKS_VISION == 0
+        flag = self.MASKS_FLAGS[mask_name]
+        return map_chunks(
+            lambda terrain_flags, entities_flags: (terrain_flags | entities_flags) & flag == 0,
+            terrain_flags, entities_flags, dtype=bool,
+        )
+
+    def get_mask(self, level_id, mask_name):
+        """Return read-only view of cached boolean mask."""
+        self.touch_level(level_id)
+        masks = self._masks[mask_name]
+        mask = masks.get(level_id)
+        if mask is None:
+            mask = self.calculate_mask(level_id, mask_name)
+            masks[level_id] = mask
+        return mask.view(writeable=False)
+
+    def update_masks(self, level_id, index):
+        """Update cached masks on given index, increment versions of changed masks."""
+        flags = None
+        for mask_name, masks in self._masks.items():
+            mask = masks.get(level_id)
+            if mask is None:
+                # Nothing cached, will be calculated when needed
+                self._versions[level_id, mask_name] += 1
+                continue
+            if flags is None:
+                flags = self.terrain_flags(level_id)[index] | self.entities_flags(level_id)[index]
+            values = flags & self.MASKS_FLAGS[mask_name] == 0
+            changed = mask[index] != values
+            if not changed.any():
+                continue
+            mask[index] = values
+            self._versions[level_id, mask_name] += 1
+            if mask_name == 'walkable':
+                self.update_exits(level_id, (index[0][changed], index[1][changed]))
+
+    def version(self, level_id, mask_name):
+        """Return current version of given mask."""
+        return self._versions[level_id, mask_name]
+
+    def has_changed(self, level_id, mask_name, version):
+        """Return True if mask changed since given version."""
+        return self._versions[level_id, mask_name] != version
+
+    def transparent(self, level_id):
+        """Return boolean mask of transparent tiles."""
+        return self.get_mask(level_id, 'transparent')
 
     def walkable(self, level_id):
         """Return boolean mask of walkable tiles."""
-        terrain_flags = self.terrain_flags(level_id)
-        entities_flags = self.entities_flags(level_id)
-        return (terrain_flags | entities_flags) & Flag.BLOCKS_VISION == 0
+        return self.get_mask(level_id, 'walkable')
 
     def revealable(self, level_id):
         """Return boolean mask of revealable tiles (transparent tiles and their neighbours)."""
-        non_transparent_bitmask = bitmask_8bit(~self.transparent(level_id), pad_value=True)
-        revealable = non_transparent_bitmask < 255
+        version = self.version(level_id, 'transparent')
+        cached_version, revealable = self._revealable.get(level_id, (None, None))
+        if revealable is None or cached_version != version:
+            # NOTE: Bitmasks need neighbours from other chunks, so whole level is calculated
+            non_transparent_bitmask = bitmask_8bit(~np.asarray(self.transparent(level_id)), pad_value=True)
+            revealable = non_transparent_bitmask < 255
+            revealable.flags.writeable = False
+            self._revealable[level_id] = (version, revealable)
         return revealable
 
     def is_movement_blocked(self, location, position=None):
         """Return True if given position allows movement."""
         position = position or location.position
-        terrain_flags = self.terrain_flags(location.level_id)
-        entities_flags = self.entities_flags(location.level_id)
-        return (terrain_flags[position] | entities_flags[position]) & Flag.BLOCKS_MOVEMENT
+        return not self.walkable(location.level_id)[position]
+
+    def exits(self, level_id):
+        """Return 8-bit bitmasks of walkable neighbours for all positions (see EXITS_BITS)."""
+        self.touch_level(level_id)
+        exits = self._exits.get(level_id)
+        if exits is None:
+            # NOTE: Bitmasks need neighbours from other chunks, so whole level is calculated
+            exits = bitmask_8bit(np.asarray(self.walkable(level_id)), pad_value=False).astype(np.uint8)
+            self._exits[level_id] = exits
+        return exits
+
+    def update_exits(self, level_id, index):
+        """Update exits bitmasks of neighbours of positions with changed walkability."""
+        exits = self._exits.get(level_id)
+        if exits is None:
+            return
+        xs, ys = index
+        width, height = exits.shape
+        walkable = self.walkable(level_id)[index].astype(np.uint8)
+        for direction, bit in EXITS_BITS.items():
+            # Neighbours that have changed position in given direction
+            neighbours_xs = xs - direction.dx
+            neighbours_ys = ys - direction.dy
+            valid = (
+                (neighbours_xs >= 0) & (neighbours_xs < width) &
+                (neighbours_ys >= 0) & (neighbours_ys < height)
+            )
+            neighbours = (neighbours_xs[valid], neighbours_ys[valid])
+            exits[neighbours] = (exits[neighbours] & ~np.uint8(1 << bit)) | (walkable[valid] << bit)
 
     def get_exits(self, location):
         """Return all available exit directions from given position."""
         # TODO: add movement_type argument and check only appopriate movement type related flag?
-        exits = set()
-        for direction in Direction:
-            target_position = location.position.move(direction)
-            if not self.is_movement_blocked(location, target_position):
-                exits.add(direction)
-        return exits
+        return EXITS_LOOKUP[self.exits(location.level_id)[location.position]]
+
+    def get_exits_bitmasks(self, level_id, positions):
+        """Return array of exits bitmasks for many positions at once, decode with EXITS_LOOKUP."""
+        return self.exits(level_id)[self.positions_index(positions)]
 
     def update_entity(self, entity, location, prev_position=None):
         """Update entity related indexes, and recalculate entities flags."""
-        if prev_position:
-            self.get_entities(location, prev_position).discard(entity)
-            self.calculate_entities_flags_position(location.level_id, prev_position)
-        self.get_entities(location).add(entity)
-        self.calculate_entities_flags_position(location.level_id, location.position)
+        self.update_entities([(entity, location, prev_position), ])
+
+    def update_entities(self, moves):
+        """Update indexes of many entities at once, and recalculate entities flags.
+
+        Moves are (entity, location, prev_position) tuples, prev_position is None for
+        entities that were not moved.
+
+        """
+        changed_positions = collections.defaultdict(set)
+        for entity, location, prev_position in moves:
+            grid = self.grid(location.level_id)
+            if prev_position:
+                grid.discard(entity, prev_position)
+                changed_positions[location.level_id].add(prev_position)
+            grid.add(entity, location.position)
+            changed_positions[location.level_id].add(location.position)
+
+        for level_id, positions in changed_positions.items():
+            self.calculate_entities_flags_positions(level_id, positions)
 
     def remove_entity(self, entity, location):
         """Remove entity from Location."""
         self.entities(location.level_id).discard(entity)
-        self.get_entities(location).discard(entity)
-        self.calculate_entities_flags_position(location.level_id, location.position)
+        self.grid(location.level_id).discard(entity, location.position)
+        self.calculate_entities_flags_positions(location.level_id, [location.position, ])
 
     def add_entity(self, entity, location):
         """Add entity to Location."""
-        self.entities(location.level_id).add(entity)
+        self._entities.setdefault(location.level_id, EntitiesSet()).add(entity)
         self.update_entity(entity, location)
 
@@ -6,8 +6,8 @@ from ..ecs import System
 from ..ecs.run_state import RunState
 
 from ..components import (
-    BlocksVisionChanged,
-    BlocksMovementChanged,
+    BlocksVision,
+    BlocksMovement,
     Location,
 )
 
@@ -22,18 +22,29 @@ class SpatialIndexingSystem(System):
         RunState.PERFOM_ACTIONS,
     }
 
+    READS = {
+        BlocksVision,
+        BlocksMovement,
+        Location,
+    }
+    WRITES = {
+        'spatial',
+    }
+
     def __init__(self, ecs):
         super().__init__(ecs)
         self.spatial = self.ecs.resources.spatial
+        self.blocks_vision_changes = self.ecs.manage(BlocksVision).track_changes()
+        self.blocks_movement_changes = self.ecs.manage(BlocksMovement).track_changes()
 
     def run(self):
-        blocks_vision_changes = self.ecs.manage(BlocksVisionChanged)
-        blocks_movement_changes = self.ecs.manage(BlocksMovementChanged)
+        changed = self.blocks_vision_changes.read().entities
+        changed.update(self.blocks_movement_changes.read().entities)
+        if not changed:
+            return
         locations = self.ecs.manage(Location)
 
-        for entity, location in self.ecs.join(blocks_vision_changes.entities, locations):
-            self.spatial.update_entity(entity, location)
-
-        for entity, location in self.ecs.join(blocks_movement_changes.entities, locations):
-            self.spatial.update_entity(entity, location)
+        self.spatial.update_entities(
+            (entity, location, None) for entity, location in self.ecs.join(changed, locations)
+        )
 
@@ -1,8 +1,11 @@
+import collections
 import logging
 
 from .. import components
-from ..ecs import System
+from ..ecs import EntitiesSet, System
 from ..ecs.run_state import RunState
+from ..geometry import Position, Size
+from ..geometry.rectangle import Rectangle
 
 from ..utils import perf
 
@@ -29,19 +32,119 @@ class ActionsQueueSystem(System):
         RunState.TICKING,
     }
 
+    READS = {
+        components.WaitsForAction,
+        'actions_queue',
+    }
+    WRITES = {
+        components.ActsNow,
+        'actions_queue',
+    }
+
+    def __init__(self, ecs):
+        super().__init__(ecs)
+        self.actions_queue = self.ecs.resources.actions_queue
+
     def run(self):
         acts_now = self.ecs.manage(components.ActsNow)
-        actions_queue = self.ecs.manage(components.WaitsForAction)
 
         # Clear previous ActsNow flags
         acts_now.clear()
 
-        for entity, wait_time in actions_queue:
-            # Decrease wait time
-            wait_time -= 1
-            if wait_time <= 0:
-                # No more waiting, time for some action!
-                acts_now.insert(entity)
+        # Skip ticks when no one acts, straight to next actions
+        for entity in self.actions_queue.pop_acting():
+            acts_now.insert(entity)
+
+
+class DormancySystem(System):
+
+    """Suspend actors far away from players (or on levels without players), resume when approached.
+
+    Only actors placed (or moved) since previous run, and actors entering or leaving areas around
+    players are suspended / resumed, so cost of a turn depends on number of actors near players,
+    not on total number of actors.
+
+    """
+
+    INCLUDE_STATES = {
+        RunState.PRE_RUN,
+        RunState.PERFOM_ACTIONS,
+    }
+
+    # Actors further away from all players are suspended
+    ACTIVE_DISTANCE = 32
+
+    READS = {
+        components.Player,
+        components.Location,
+        components.Actor,
+        components.WaitsForAction,
+    }
+    WRITES = {
+        'actions_queue',
+        'spatial',
+    }
+
+    def __init__(self, ecs):
+        super().__init__(ecs)
+        self.spatial = self.ecs.resources.spatial
+        self.actions_queue = self.ecs.resources.actions_queue
+        locations = self.ecs.manage(components.Location)
+        self.locations_changes = locations.track_changes()
+        # NOTE: Entities placed before system was created (like on pregenerated levels) are
+        #       not recorded by changes cursor, check them on first run
+        self.not_checked = EntitiesSet(locations.keys())
+        # level_id -> actors near players found on previous run
+        self.nearby = {}
+
+    def get_nearby(self, level_id, positions):
+        """Return actors within ACTIVE_DISTANCE (chebyshev) from any of given positions."""
+        actors = self.ecs.manage(components.Actor)
+        distance = self.ACTIVE_DISTANCE
+        size = Size(2*distance+1, 2*distance+1)
+        nearby = EntitiesSet()
+        for position in positions:
+            area = Rectangle(Position(position.x-distance, position.y-distance), size)
+            nearby.update(self.spatial.query_rect(level_id, area))
+        return EntitiesSet(nearby & actors.keys())
+
+    def run(self):
+        changes = self.locations_changes.read()
+        if not changes and not self.not_checked:
+            return
+        placed = EntitiesSet(changes.changed | self.not_checked)
+        self.not_checked = EntitiesSet()
+
+        # Make sure recently inserted WaitsForAction are already scheduled
+        self.actions_queue.update()
+
+        players_positions = collections.defaultdict(list)
+        for player, is_player, location in self.ecs.query(components.Player, components.Location):
+            players_positions[location.level_id].append(location.position)
+
+        nearby = {
+            level_id: self.get_nearby(level_id, positions)
+            for level_id, positions in players_positions.items()
+        }
+
+        # Actors that left areas around players (or levels left by players)
+        for level_id, prev_nearby in self.nearby.items():
+            for actor in prev_nearby - nearby.get(level_id, EntitiesSet()):
+                self.actions_queue.suspend(actor)
+
+        # Actors that entered areas around players
+        for level_id, level_nearby in nearby.items():
+            for actor in level_nearby - self.nearby.get(level_id, EntitiesSet()):
+                self.actions_queue.resume(actor)
+
+        # Actors placed away from players
+        actors = self.ecs.manage(components.Actor)
+        locations = self.ecs.manage(components.Location)
+        for actor, handler, location in self.ecs.join(placed, actors, locations):
+            if not actor in nearby.get(location.level_id, EntitiesSet()):
+                self.actions_queue.suspend(actor)
+
+        self.nearby = nearby
 
 
 # TODO: AIActionsSystem, for player just wait?
@@ -55,9 +158,8 @@ class TakeActionsSystem(System):
         acts_now = self.ecs.manage(components.ActsNow)
         if not acts_now:
             return
-        actions_handlers = self.ecs.manage(components.Actor)
 
-        for actor, handler in self.ecs.join(acts_now.entities, actions_handlers):
+        for actor, is_acting, handler in self.ecs.query(components.ActsNow, components.Actor):
             # TODO: Initialize handler with actor, and set to component for later?
             if not handler.take_action(actor):
                 break
@@ -69,6 +171,14 @@ class RestingSystem(System):
         RunState.PERFOM_ACTIONS,
     }
 
+    READS = {
+        components.Player,
+        components.WantsToRest,
+    }
+    WRITES = {
+        components.WantsToRest,
+    }
+
     def run(self):
         players = self.ecs.manage(components.Player)
         wants_to_rest = self.ecs.manage(components.WantsToRest)
@@ -86,6 +196,18 @@ class MovementSystem(System):
         RunState.PERFOM_ACTIONS,
     }
 
+    READS = {
+        components.Player,
+        components.Name,
+        components.Location,
+        components.WantsToMove,
+    }
+    WRITES = {
+        components.Location,
+        components.WantsToMove,
+        'spatial',
+    }
+
     def __init__(self, ecs):
         super().__init__(ecs)
         self.spatial = self.ecs.resources.spatial
@@ -95,19 +217,20 @@ class MovementSystem(System):
         names = self.ecs.manage(components.Name)
         locations = self.ecs.manage(components.Location)
         movement_directions = self.ecs.manage(components.WantsToMove)
-        has_moved = self.ecs.manage(components.HasMoved)
-
-        has_moved.clear()
 
-        for entity, location, direction in self.ecs.join(self.ecs.entities, locations, movement_directions):
+        moves = []
+        for entity, location, direction in self.ecs.query(components.Location, components.WantsToMove):
             if entity in players:
                 msg_log.info(f'{names.get(entity)} MOVE: {direction}')
 
             # Update position
             from_position = location.position
             location.position = location.position.move(direction)
-            self.spatial.update_entity(entity, location, from_position)
-            has_moved.insert(entity)
+            moves.append((entity, location, from_position))
+
+        # Update spatial index with all moves at once
+        self.spatial.update_entities(moves)
+        locations.mark_modified(*[entity for entity, location, from_position in moves])
 
         # Clear processed movement intents
         movement_directions.clear()
@@ -146,35 +269,27 @@ class OperateSystem(System):
         RunState.PERFOM_ACTIONS,
     }
 
+    READS = {
+        components.Player,
+        components.Name,
+        components.WantsToOperate,
+        components.OnOperate,
+    }
+    WRITES = None  # via ecs.commands
+
     def run(self):
         players = self.ecs.manage(components.Player)
         names = self.ecs.manage(components.Name)
         operate_targets = self.ecs.manage(components.WantsToOperate)
         operations = self.ecs.manage(components.OnOperate)
-        blocks_vision_changes = self.ecs.manage(components.BlocksVisionChanged)
-        blocks_movement_changes = self.ecs.manage(components.BlocksMovementChanged)
-
-        blocks_vision_changes.clear()
-        blocks_movement_changes.clear()
 
         for entity, target in operate_targets:
             if entity in players:
                 msg_log.info(f'{names.get(entity)} OPERATE: {names.get(target)}')
             operation = operations.get(target)
             for component in operation.insert:
-                if component == components.BlocksVision:
-                    blocks_vision_changes.insert(target)
-                if component == components.BlocksMovement:
-                    blocks_movement_changes.insert(target)
-                manager = self.ecs.manage(component)
-                manager.insert(target, component=component)
-            for component in operation.remove:
-                if component == components.BlocksVision:
-                    blocks_vision_changes.insert(target)
-                if component == components.BlocksMovement:
-                    blocks_movement_changes.insert(target)
-                manager = self.ecs.manage(component)
-                manager.remove(target)
+                self.ecs.commands.insert(target, component)
+            self.ecs.commands.remove(target, *operation.remove)
 
         # Clear processed targets
         operate_targets.clear()
@@ -186,6 +301,9 @@ class ActionsPerformedSystem(System):
         RunState.ACTIONS_PERFORMED,
     }
 
+    READS = set()
+    WRITES = set()
+
     def run(self):
         pass
 
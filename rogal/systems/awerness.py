@@ -1,7 +1,7 @@
 import collections
 import logging
 
-import tcod.map
+import numpy as np
 
 from .. import components
 from ..ecs import System, EntitiesSet
@@ -20,39 +20,68 @@ class InvalidateViewshedsSystem(System):
         RunState.PERFOM_ACTIONS,
     }
 
+    READS = {
+        components.BlocksVision,
+        components.Location,
+        components.Viewshed,
+    }
+    WRITES = {
+        components.Viewshed,
+        'viewsheds_index',
+    }
+
+    def __init__(self, ecs):
+        super().__init__(ecs)
+        self.viewsheds_index = self.ecs.resources.viewsheds_index
+        self.blocks_vision_changes = self.ecs.manage(components.BlocksVision).track_changes()
+        self.locations_changes = self.ecs.manage(components.Location).track_changes()
+        self.viewsheds_changes = self.ecs.manage(components.Viewshed).track_changes()
+
+    def on_viewsheds_removed(self):
+        for entity in self.viewsheds_changes.read().removed:
+            self.viewsheds_index.remove(entity)
+
     def on_blocks_vision_changed(self):
-        blocks_vision_changes = self.ecs.manage(components.BlocksVisionChanged)
+        blocks_vision_changes = self.blocks_vision_changes.read()
         if not blocks_vision_changes:
             return
         locations = self.ecs.manage(components.Location)
-        viewsheds = self.ecs.manage(components.Viewshed)
 
         # Invalidate Viewshed of all entities with target in viewshed
-        positions_per_level = collections.defaultdict(set)
+        positions_per_level = collections.defaultdict(list)
         for entity, location in self.ecs.join(blocks_vision_changes.entities, locations):
-            positions_per_level[location.level_id].add(location.position)
+            positions_per_level[location.level_id].append(location.position)
 
         if not positions_per_level:
             return
 
         viewsheds = self.ecs.manage(components.Viewshed)
-        for viewshed, location in self.ecs.join(viewsheds, locations):
-            if viewshed.positions & positions_per_level[location.level_id]:
-                viewshed.invalidate()
-
-    def on_has_moved(self):
+        for level_id, positions in positions_per_level.items():
+            # (xs, ys) index arrays of changed positions
+            index = tuple(np.array(positions, dtype=np.intp).T)
+            # Only viewsheds with window covering any of changed positions
+            candidates = self.viewsheds_index.query(level_id, index)
+            for entity in [entity for entity in candidates if not entity in viewsheds]:
+                # Viewshed added and removed before changes were read
+                self.viewsheds_index.remove(entity)
+            for entity, location, viewshed in self.ecs.join(candidates, locations, viewsheds):
+                if location.level_id == level_id and viewshed.visible(index).any():
+                    viewshed.invalidate()
+
+    def on_location_changed(self):
         # Invalidate Viewshed after moving
-        has_moved = self.ecs.manage(components.HasMoved)
+        has_moved = self.locations_changes.read().changed
         if not has_moved:
             return
         viewsheds = self.ecs.manage(components.Viewshed)
 
-        for entity, viewshed in self.ecs.join(has_moved.entities, viewsheds):
+        for entity, viewshed in self.ecs.join(has_moved, viewsheds):
             viewshed.invalidate()
 
     def run(self):
+        self.on_viewsheds_removed()
         self.on_blocks_vision_changed()
-        self.on_has_moved()
+        self.on_location_changed()
 
 
 class RevealLevelSystem(System):
@@ -62,6 +91,17 @@ class RevealLevelSystem(System):
         # RunState.PERFOM_ACTIONS,
     }
 
+    READS = {
+        components.WantsToRevealLevel,
+        components.LevelMemory,
+        components.Location,
+    }
+    WRITES = {
+        components.WantsToRevealLevel,
+        components.LevelMemory,
+        'spatial',
+    }
+
     def __init__(self, ecs):
         super().__init__(ecs)
         self.spatial = self.ecs.resources.spatial
@@ -74,7 +114,8 @@ class RevealLevelSystem(System):
         locations = self.ecs.manage(components.Location)
 
         for entity, memory, location in self.ecs.join(wants_to_reveal.entities, level_memories, locations):
-            memory.update(location.level_id, self.spatial.revealable(location.level_id))
+            level = self.spatial.get_level(location.level_id)
+            memory.update(location.level_id, level.size, self.spatial.revealable(location.level_id))
             msg_log.warning('Level revealed!')
 
         wants_to_reveal.clear()
@@ -87,57 +128,67 @@ class VisibilitySystem(System):
         RunState.PERFOM_ACTIONS,
     }
 
+    READS = {
+        components.Player,
+        components.Monster,
+        components.Name,
+        components.Location,
+        components.Viewshed,
+        components.LevelMemory,
+    }
+    WRITES = {
+        components.Viewshed,
+        components.LevelMemory,
+        'viewsheds_index',
+        'spatial',
+        'fov',
+    }
+
     def __init__(self, ecs):
         super().__init__(ecs)
         self.spatial = self.ecs.resources.spatial
+        self.fov = self.ecs.resources.fov
+        self.viewsheds_index = self.ecs.resources.viewsheds_index
 
     def update_viewsheds(self):
-        players = self.ecs.manage(components.Player)
-        locations = self.ecs.manage(components.Location)
-        viewsheds = self.ecs.manage(components.Viewshed)
         level_memories = self.ecs.manage(components.LevelMemory)
 
-        #  Update Viesheds that needs update
-        for entity, location, viewshed in self.ecs.join(self.ecs.entities, locations, viewsheds):
+        #  Viesheds that needs update, per level
+        needs_update = collections.defaultdict(list)
+        for entity, location, viewshed in self.ecs.query(components.Location, components.Viewshed):
             if not viewshed.needs_update:
                 # No need to recalculate
                 continue
-
-            # TODO: Move to separate module?
-            fov = tcod.map.compute_fov(
-                transparency=self.spatial.transparent(location.level_id),
-                pov=location.position,
-                radius=viewshed.view_range,
-                light_walls=True,
-                # algorithm=tcod.FOV_BASIC,
-                # algorithm=tcod.FOV_SHADOW,
-                # algorithm=tcod.FOV_DIAMOND,
-                algorithm=tcod.FOV_RESTRICTIVE,
-                # algorithm=tcod.FOV_PERMISSIVE(1),
-                # algorithm=tcod.FOV_PERMISSIVE(8),
-                # algorithm=tcod.FOV_SYMMETRIC_SHADOWCAST,
+            needs_update[location.level_id].append([entity, location, viewshed])
+
+        for level_id, viewers in needs_update.items():
+            level = self.spatial.get_level(level_id)
+            fovs = self.fov.compute_many(
+                self.spatial.transparent(level_id),
+                [(location.position, viewshed.view_range) for entity, location, viewshed in viewers],
+                level_id,
             )
+            for (entity, location, viewshed), (fov, offset) in zip(viewers, fovs):
+                viewshed.update(fov, offset)
+                width, height = fov.shape
+                self.viewsheds_index.update(
+                    entity, level_id, offset.x, offset.y, offset.x+width, offset.y+height)
 
-            viewshed.update(fov)
-
-            memory = level_memories.get(entity)
-            if memory:
-                memory.update(location.level_id, fov)
+                memory = level_memories.get(entity)
+                if memory:
+                    memory.update(level_id, level.size, fov, offset)
 
     def spotted_alert(self):
-        # NOTE: It's SLOOOOOOOOOOOW!!! Use only for player for now, needs rewrite anyway
         players = self.ecs.manage(components.Player)
-        locations = self.ecs.manage(components.Location)
-        viewsheds = self.ecs.manage(components.Viewshed)
 
-        # for entity, location, viewshed in self.ecs.join(self.ecs.entities, locations, viewsheds):
-        for entity, location, viewshed in self.ecs.join(players.entities, locations, viewsheds):
+        # for entity, location, viewshed in self.ecs.query(components.Location, components.Viewshed):
+        for entity, player, location, viewshed in self.ecs.query(
+            components.Player, components.Location, components.Viewshed,
+        ):
+            if viewshed.fov is None:
+                continue
 
-            # This! This is the part that is very costly
-            visible_entities = EntitiesSet()
-            visible_entities.update(*[entities for entities in
-                                      [self.spatial.get_entities(location, position)
-                                       for position in viewshed.positions]])
+            visible_entities = self.spatial.query_mask(location.level_id, viewshed.fov, viewshed.offset)
             spotted_entities = EntitiesSet(visible_entities - viewshed.entities)
             viewshed.entities = visible_entities
 
@@ -26,7 +26,6 @@ class LevelsSystem(System):
         wants_to_change_level = self.ecs.manage(components.WantsToChangeLevel)
         levels = self.ecs.manage(components.Level)
         locations = self.ecs.manage(components.Location)
-        has_moved = self.ecs.manage(components.HasMoved)
 
         for entity, level_id in wants_to_change_level:
             level_id = level_id or int(self.level_generator.init_level())
@@ -38,7 +37,6 @@ class LevelsSystem(System):
                 self.spatial.remove_entity(entity, prev_location)
             location = locations.insert(entity, level_id, starting_position)
             self.spatial.add_entity(entity, location)
-            has_moved.insert(entity)
 
         wants_to_change_level.clear()
 
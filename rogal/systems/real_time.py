@@ -18,6 +18,12 @@ class TTLSystem(System):
         RunState.ANIMATIONS,
     }
 
+    READS = {
+        components.TTL,
+        components.Location,
+    }
+    WRITES = None  # via ecs.commands
+
     def __init__(self, ecs):
         super().__init__(ecs)
         self.spatial = self.ecs.resources.spatial
@@ -36,5 +42,5 @@ class TTLSystem(System):
         locations = self.ecs.manage(components.Location)
         for entity, location in self.ecs.join(outdated, locations):
             self.spatial.remove_entity(entity, location)
-        self.ecs.remove(*outdated)
+        self.ecs.commands.destroy(*outdated)
 
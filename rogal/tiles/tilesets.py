@@ -36,9 +36,10 @@ class Tileset:
 
     @property
     def tiles_sources(self):
+        # NOTE: Parsed separately, so tiles are available without loading fonts (headless mode)
         if self._tiles_sources is None:
             data = self.loader.load()
-            self.parse_data(data)
+            self._tiles_sources = self.parse_tiles_sources(data)
         return self._tiles_sources
 
     @property
@@ -96,7 +97,6 @@ class Tileset:
         return tiles
 
     def parse_data(self, data):
-        self._tiles_sources = self.parse_tiles_sources(data)
         self._palette = self.parse_palette(data)
         self._revealed_fn = self.parse_revealed_fn(data)
         self._tiles = self.parse_tiles(data)
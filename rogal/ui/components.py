@@ -37,7 +37,6 @@ class Widget(Component):
 
 
 ContentChanged = Flag('ContentChanged')
-SelectorChanged = Flag('SelectorChanged')
 
 
 @functools.total_ordering
@@ -3,6 +3,7 @@ import logging
 
 import numpy as np
 
+from .. import dtypes
 from ..ecs.core import Entity, EntitiesSet
 
 from ..toolkit.core import ZOrder
@@ -10,7 +11,7 @@ from ..toolkit.core import ZOrder
 from .components import (
     CreateElement, DestroyElement, DestroyElementContent,
     ElementPath, ChildElements,
-    Widget, ContentChanged, SelectorChanged,
+    Widget, ContentChanged,
     Renderer,
     Layout,
     GrabInputFocus, InputFocus, HasInputFocus, CurrentInputFocus,
@@ -90,7 +91,6 @@ class UIManager:
                 element, content, selector,
             )
             self.ecs.manage(ContentChanged).insert(element)
-            self.ecs.manage(SelectorChanged).insert(element)
         if renderer:
             self.ecs.manage(Renderer).insert(
                 element, renderer,
@@ -109,10 +109,7 @@ class UIManager:
         widget.selector.pseudo_classes = pseudo_classes
 
         child_elements = self.ecs.manage(ChildElements)
-        changed_selectors = self.ecs.manage(SelectorChanged)
-        changed_selectors.insert(element)
-        for child in child_elements.get(element):
-            changed_selectors.insert(child)
+        widgets.mark_modified(element, *child_elements.get(element))
 
     def redraw(self, element):
         self.ecs.manage(ContentChanged).insert(element)
@@ -140,7 +137,7 @@ class InputFocusManager:
     def positions(self):
         if self._positions is None:
             root_panel = self.ecs.resources.root_panel
-            self._positions = np.zeros(root_panel.size, dtype=(np.void, 16), order="C")
+            self._positions = np.zeros(root_panel.size, dtype=dtypes.ENTITY_DT, order="C")
         return self._positions
 
     def clear_positions(self):
@@ -160,7 +157,7 @@ class InputFocusManager:
         self.ecs.manage(InputFocus).remove(element)
 
     def update_positions(self, entity, panel):
-        self.positions[panel.x : panel.x2, panel.y : panel.y2] = entity.bytes
+        self.positions[panel.x : panel.x2, panel.y : panel.y2] = entity
 
     def propagate_from(self, entity, filter_by=None):
         if not entity:
@@ -178,7 +175,7 @@ class InputFocusManager:
         max_x, max_y = self.positions.shape
         if position.x >= max_x or position.y >= max_y:
             return
-        return Entity(self.positions[position].tobytes())
+        return Entity(int(self.positions[position]))
 
     def propagate_from_position(self, position):
         target = self.get_position(position)
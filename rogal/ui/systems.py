@@ -11,7 +11,7 @@ from ..ecs.run_state import RunState
 from .components import (
     CreateElement, DestroyElement, DestroyElementContent,
     ElementPath, ChildElements,
-    Widget, ContentChanged, SelectorChanged,
+    Widget, ContentChanged,
     Layout, LayoutChanged,
     Renderer,
     InputFocus, HasInputFocus, GrabInputFocus,
@@ -95,6 +95,7 @@ class StyleSystem(System):
     def __init__(self, ecs):
         super().__init__(ecs)
         self.stylesheets = self.ecs.resources.stylesheets_manager
+        self.widgets_changes = self.ecs.manage(Widget).track_changes()
 
     def get_selectors_path(self, element):
         element_paths = self.ecs.manage(ElementPath)
@@ -107,18 +108,17 @@ class StyleSystem(System):
         return selectors_path
 
     def run(self):
-        changed_selectors = self.ecs.manage(SelectorChanged)
+        changed_selectors = self.widgets_changes.read().changed
         if not changed_selectors:
             return
         widgets = self.ecs.manage(Widget)
-        for element, widget in self.ecs.join(changed_selectors.entities, widgets):
+        for element, widget in self.ecs.join(changed_selectors, widgets):
             selectors_path = self.get_selectors_path(element)
             # print('>>>', selectors_path)
             style = self.stylesheets.get(selectors_path)
             if not style:
                 continue
             widget.set_style(**style)
-        changed_selectors.clear()
 
 
 class UISystem(System):
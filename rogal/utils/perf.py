@@ -1,7 +1,10 @@
 import atexit
 import collections
 from functools import wraps
+import json
 import logging
+import os.path
+import threading
 import time
 import types
 
@@ -11,18 +14,105 @@ from decorator import decorator
 log = logging.getLogger(__name__)
 
 
+NS_PER_SEC = 1_000_000_000
+
+
 @decorator
 def timeit(func, *args, **kwargs):
-    ts = time.time()
+    ts = time.perf_counter()
     result = func(*args, **kwargs)
-    te = time.time()
+    te = time.perf_counter()
     log.debug(f'PERF: {func.__name__}({args}, {kwargs}) -> {te-ts:2.4f} sec')
     return result
 
 
+class Histogram:
+
+    """Fixed memory, log-linear histogram of integer values (HDR-style buckets).
+
+    Values below 2*SUB_BUCKETS are stored exactly, above that each power of 2 range
+    is split into SUB_BUCKETS linear buckets, so relative error is below 1/SUB_BUCKETS.
+    Number of buckets is bounded by value's bit_length, not by number of values.
+
+    """
+
+    SUB_BUCKET_BITS = 4
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max', )
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def bucket_index(cls, value):
+        if value < 2*cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        return ((shift+1) << cls.SUB_BUCKET_BITS) + (value >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def bucket_range(cls, index):
+        """Return (lowest, highest) value that fits in bucket with given index."""
+        if index < 2*cls.SUB_BUCKETS:
+            return index, index
+        shift = (index >> cls.SUB_BUCKET_BITS) - 1
+        mantissa = (index & (cls.SUB_BUCKETS-1)) + cls.SUB_BUCKETS
+        return mantissa << shift, ((mantissa+1) << shift) - 1
+
+    def add(self, value):
+        index = self.bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percentile):
+        """Return approximated value at given percentile (0-100)."""
+        if not self.count:
+            return None
+        rank = max(1, round(self.count * percentile / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                lowest, highest = self.bucket_range(index)
+                # Clamp bucket's midpoint to exactly known boundaries
+                return min(max((lowest + highest) // 2, self.min), self.max)
+        return self.max
+
+    @property
+    def avg(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def clear(self):
+        self.counts.clear()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return self.count
+
+
 class Perf:
 
-    _PERF_STATS = collections.defaultdict(list)
+    _PERF_STATS = collections.defaultdict(Histogram)
+
+    ENABLED = True
+
+    # NOTE: Systems run in parallel record their stats from worker threads
+    lock = threading.Lock()
 
     __slots__ = ('name', 'start', )
 
@@ -31,12 +121,16 @@ class Perf:
             # Use fully qualified method/function names
             name = f'{name.__module__}.{name.__qualname__}()'
         self.name = name
-        self.start = time.time()
+        self.start = time.perf_counter_ns()
 
     def elapsed(self):
-        elapsed = time.time() - self.start
-        self._PERF_STATS[self.name].append(elapsed)
-        return elapsed
+        elapsed = time.perf_counter_ns() - self.start
+        if self.ENABLED:
+            with self.lock:
+                self._PERF_STATS[self.name].add(elapsed)
+        if Tracer.ENABLED:
+            Tracer.add_span(self.name, self.start, elapsed)
+        return elapsed / NS_PER_SEC
 
     def __enter__(self):
         return self
@@ -44,17 +138,192 @@ class Perf:
     def __exit__(self, *args):
         self.elapsed()
 
+    @classmethod
+    def enable(cls):
+        cls.ENABLED = True
+
+    @classmethod
+    def disable(cls):
+        cls.ENABLED = False
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls._PERF_STATS.clear()
+
+    @classmethod
+    def names(cls):
+        """Return sorted names with recorded stats."""
+        with cls.lock:
+            return sorted(cls._PERF_STATS.keys())
+
+    @classmethod
+    def get_stats(cls, name=None):
+        """Return stats (in seconds) for given name, or dict of stats for all names."""
+        if not name:
+            return {
+                name: cls.get_stats(name)
+                for name in cls.names()
+            }
+        with cls.lock:
+            histogram = cls._PERF_STATS.get(name)
+            if not histogram:
+                return None
+            return dict(
+                calls=histogram.count,
+                total=histogram.total / NS_PER_SEC,
+                avg=histogram.avg / NS_PER_SEC,
+                p50=histogram.percentile(50) / NS_PER_SEC,
+                p95=histogram.percentile(95) / NS_PER_SEC,
+                p99=histogram.percentile(99) / NS_PER_SEC,
+                max=histogram.max / NS_PER_SEC,
+            )
+
+    @classmethod
+    def dump(cls, fn):
+        """Export stats of all names to JSON file."""
+        with open(fn, 'w') as f:
+            json.dump(cls.get_stats(), f, indent=2)
+
     @classmethod
     def stats(cls, name=None):
         if not name:
             log.debug('Perf stats:')
-            for name in sorted(cls._PERF_STATS.keys()):
+            for name in cls.names():
                 cls.stats(name)
             return
-        times = cls._PERF_STATS[name]
-        total = sum(times)
-        avg = total / len(times)
-        med = sorted(times)[len(times)//2]
-        log.debug(f'{name:60s} - calls: {len(times):7d}   avg: {avg:2.4f}   med: {med:2.4f}   max: {max(times):2.4f}   total: {total:2.4f}')
+        stats = cls.get_stats(name)
+        if not stats:
+            return
+        log.debug(
+            f'{name:60s} - calls: {stats["calls"]:7d}   avg: {stats["avg"]:2.4f}   '
+            f'p50: {stats["p50"]:2.4f}   p95: {stats["p95"]:2.4f}   p99: {stats["p99"]:2.4f}   '
+            f'max: {stats["max"]:2.4f}   total: {stats["total"]:2.4f}'
+        )
 
 atexit.register(Perf.stats)
+
+
+class Tracer:
+
+    """Records Perf spans of last N frames, exportable as Chrome trace_event JSON.
+
+    Spans are stored as raw tuples in a ring buffer of frames, and converted to
+    complete ("X") trace events only on dump. Nesting is implied by timestamps,
+    spans from different threads are recorded with their thread IDs.
+
+    Open dumped files with chrome://tracing or https://ui.perfetto.dev
+
+    """
+
+    ENABLED = False
+
+    frames = collections.deque(maxlen=100)
+    spans = []
+    frame_start = None
+    frame_args = None
+
+    slow_frame = None
+    dump_fn = './logs/trace-{frame}.json'
+    frames_count = 0
+
+    lock = threading.Lock()
+
+    @classmethod
+    def enable(cls, max_frames=100, slow_frame=None, dump_fn=None):
+        """Start tracing last max_frames, dump them when frame takes longer than slow_frame seconds."""
+        cls.frames = collections.deque(maxlen=max_frames)
+        cls.slow_frame = slow_frame and int(slow_frame * NS_PER_SEC)
+        if dump_fn:
+            cls.dump_fn = dump_fn
+        cls.ENABLED = True
+
+    @classmethod
+    def disable(cls):
+        cls.ENABLED = False
+        cls.frames.clear()
+        cls.spans = []
+        cls.frame_start = None
+
+    @classmethod
+    def add_span(cls, name, start, duration):
+        # NOTE: list.append is atomic, spans might be added from systems run in parallel
+        cls.spans.append((name, threading.get_ident(), start, duration))
+
+    @classmethod
+    def begin_frame(cls, **args):
+        """Start new frame, args (like current RunState) are added to all its events."""
+        if not cls.ENABLED:
+            return
+        cls.spans = []
+        cls.frame_args = args
+        cls.frame_start = time.perf_counter_ns()
+
+    @classmethod
+    def end_frame(cls):
+        if not cls.ENABLED or cls.frame_start is None:
+            return
+        duration = time.perf_counter_ns() - cls.frame_start
+        cls.frames_count += 1
+        with cls.lock:
+            cls.frames.append(
+                (cls.frames_count, cls.frame_start, duration, cls.frame_args, cls.spans)
+            )
+        cls.frame_start = None
+        if cls.slow_frame and duration > cls.slow_frame:
+            log.warning(f'Slow frame #{cls.frames_count}: {duration/NS_PER_SEC:2.4f} sec')
+            cls.dump()
+
+    @classmethod
+    def frame(cls, **args):
+        """Return context manager wrapping single frame."""
+        return TracerFrame(args)
+
+    @classmethod
+    def get_events(cls):
+        """Return recorded frames as list of trace_event dicts."""
+        pid = os.getpid()
+        main_tid = threading.main_thread().ident
+        events = []
+        with cls.lock:
+            frames = list(cls.frames)
+        for frame, frame_start, frame_duration, args, spans in frames:
+            events.append(dict(
+                name=f'frame #{frame}', cat='frame', ph='X', pid=pid, tid=main_tid,
+                ts=frame_start/1000, dur=frame_duration/1000,
+                args=args,
+            ))
+            for name, tid, start, duration in spans:
+                events.append(dict(
+                    name=name, cat='perf', ph='X', pid=pid, tid=tid,
+                    ts=start/1000, dur=duration/1000,
+                    args=args,
+                ))
+        return events
+
+    @classmethod
+    def dump(cls, fn=None):
+        """Export recorded frames to Chrome trace_event JSON file, return its name."""
+        fn = fn or cls.dump_fn.format(frame=cls.frames_count)
+        dirname = os.path.dirname(fn)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with open(fn, 'w') as f:
+            json.dump(dict(traceEvents=cls.get_events(), displayTimeUnit='ms'), f)
+        log.info(f'Trace dumped: {fn}')
+        return fn
+
+
+class TracerFrame:
+
+    __slots__ = ('args', )
+
+    def __init__(self, args):
+        self.args = args
+
+    def __enter__(self):
+        Tracer.begin_frame(**self.args)
+        return self
+
+    def __exit__(self, *args):
+        Tracer.end_frame()
@@ -0,0 +1,167 @@
+import unittest
+import uuid
+
+from rogal.ecs import ECS
+from rogal.actions_queue import ActionsQueue
+from rogal.geometry import Position, Size
+from rogal.spatial.spatial_index import SpatialIndex
+from rogal.systems.actions import DormancySystem
+from rogal import components
+
+
+class ActionsQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ecs = ECS()
+        self.waits_for_action = self.ecs.manage(components.WaitsForAction)
+        self.queue = ActionsQueue(self.ecs)
+
+    def test_pop_acting(self):
+        first = self.ecs.create(components.WaitsForAction(3))
+        second = self.ecs.create(components.WaitsForAction(1))
+        third = self.ecs.create(components.WaitsForAction(3))
+
+        self.assertEqual(self.queue.pop_acting(), {second})
+        self.assertEqual(self.queue.tick, 1)
+        # Not rescheduled, still acting on next tick
+        self.assertEqual(self.queue.pop_acting(), {second})
+        self.assertEqual(self.queue.tick, 2)
+
+        self.waits_for_action.insert(second, 5)
+        self.assertEqual(self.queue.pop_acting(), {first, third})
+        self.assertEqual(self.queue.tick, 3)
+
+        self.waits_for_action.insert(first, 60)
+        self.waits_for_action.insert(third, 0)
+        self.assertEqual(self.queue.pop_acting(), {third})
+        self.assertEqual(self.queue.tick, 4)
+
+        self.waits_for_action.insert(third, 60)
+        self.assertEqual(self.queue.pop_acting(), {second})
+        self.assertEqual(self.queue.tick, 7)
+
+    def test_unschedule(self):
+        first = self.ecs.create(components.WaitsForAction(2))
+        second = self.ecs.create(components.WaitsForAction(2))
+        self.ecs.remove(first)
+        self.assertEqual(self.queue.pop_acting(), {second})
+        self.assertNotIn(first, self.queue)
+
+        self.waits_for_action.discard(second)
+        self.assertEqual(self.queue.pop_acting(), set())
+        self.assertEqual(len(self.queue), 0)
+
+    def test_existing_entities(self):
+        entity = self.ecs.create(components.WaitsForAction(10))
+        queue = ActionsQueue(self.ecs)
+        self.assertEqual(queue.pop_acting(), {entity})
+        self.assertEqual(queue.tick, 10)
+
+    def test_suspend_resume(self):
+        dormant = self.ecs.create(components.WaitsForAction(3))
+        active = self.ecs.create(components.WaitsForAction(5))
+        self.queue.update()
+        self.queue.suspend(dormant)
+        self.assertTrue(self.queue.is_suspended(dormant))
+        self.assertNotIn(dormant, self.queue)
+        self.assertEqual(self.queue.pop_acting(), {active})
+        self.assertEqual(self.queue.tick, 5)
+
+        # Rescheduled while suspended
+        self.waits_for_action.insert(active, 10)
+        self.waits_for_action.insert(dormant, 2)
+        self.queue.resume(dormant)
+        self.queue.resume(active)
+        self.assertFalse(self.queue.is_suspended(dormant))
+        self.assertEqual(self.queue.pop_acting(), {dormant})
+        self.assertEqual(self.queue.tick, 7)
+
+        # Overdue actor suspended, acts right after resuming
+        self.queue.suspend(dormant)
+        self.assertEqual(self.queue.pop_acting(), {active})
+        self.assertEqual(self.queue.tick, 15)
+        self.queue.resume(dormant)
+        self.assertEqual(self.queue.pop_acting(), {active, dormant})
+        self.assertEqual(self.queue.tick, 16)
+
+
+class DormancySystemTests(unittest.TestCase):
+
+    SIZE = Size(80, 20)
+
+    def setUp(self):
+        self.ecs = ECS()
+        self.spatial = self.ecs.resources.spatial = SpatialIndex(self.ecs)
+        self.queue = self.ecs.resources.actions_queue = ActionsQueue(self.ecs)
+        self.level_id = self.create_level(0)
+
+    def create_level(self, depth):
+        terrain = self.spatial.init_terrain(self.SIZE)
+        return self.spatial.create_level(uuid.uuid4(), depth, terrain)
+
+    def create(self, level_id, position, *args):
+        location = components.Location(level_id, position)
+        entity = self.ecs.create(location, *args)
+        self.spatial.add_entity(entity, location)
+        return entity
+
+    def create_actor(self, level_id, position):
+        return self.create(
+            level_id, position,
+            components.Actor(None), components.WaitsForAction(10),
+        )
+
+    def test_suspend_far_away(self):
+        system = DormancySystem(self.ecs)
+        player = self.create(self.level_id, Position(5, 5), components.Player)
+        near = self.create_actor(self.level_id, Position(5+DormancySystem.ACTIVE_DISTANCE, 0))
+        far = self.create_actor(self.level_id, Position(6+DormancySystem.ACTIVE_DISTANCE, 5))
+        system.run()
+        self.assertFalse(self.queue.is_suspended(near))
+        self.assertTrue(self.queue.is_suspended(far))
+
+        # Player approaches, far actor is resumed
+        locations = self.ecs.manage(components.Location)
+        location = locations.get(player)
+        prev_position = location.position
+        location.position = Position(10, 5)
+        locations.mark_modified(player)
+        self.spatial.update_entity(player, location, prev_position)
+        system.run()
+        self.assertFalse(self.queue.is_suspended(near))
+        self.assertFalse(self.queue.is_suspended(far))
+
+        # Actor walks away, without player moving
+        location = locations.get(near)
+        prev_position = location.position
+        location.position = Position(79, 19)
+        locations.mark_modified(near)
+        self.spatial.update_entity(near, location, prev_position)
+        system.run()
+        self.assertTrue(self.queue.is_suspended(near))
+        self.assertFalse(self.queue.is_suspended(far))
+
+        # Player leaves the level
+        location = locations.get(player)
+        self.spatial.remove_entity(player, location)
+        location.level_id = self.create_level(1)
+        locations.mark_modified(player)
+        self.spatial.add_entity(player, location)
+        system.run()
+        self.assertTrue(self.queue.is_suspended(far))
+
+    def test_suspend_on_levels_without_players(self):
+        # Actors on levels pregenerated before system was created
+        pregenerated_level_id = self.create_level(1)
+        pregenerated = self.create_actor(pregenerated_level_id, Position(5, 5))
+        system = DormancySystem(self.ecs)
+        self.create(self.level_id, Position(5, 5), components.Player)
+        system.run()
+        self.assertTrue(self.queue.is_suspended(pregenerated))
+
+        # Actors placed later on levels that no player ever visited
+        level_id = self.create_level(2)
+        spawned = self.create_actor(level_id, Position(5, 5))
+        system.run()
+        self.assertTrue(self.queue.is_suspended(spawned))
+        self.assertTrue(self.queue.is_suspended(pregenerated))
@@ -0,0 +1,100 @@
+import unittest
+
+import numpy as np
+
+from rogal.collections.chunked_array import ChunkedArray, map_chunks
+
+
+class ChunkedArrayTests(unittest.TestCase):
+
+    SHAPE = (100, 70)
+
+    def setUp(self):
+        self.array = ChunkedArray(self.SHAPE, dtype=np.uint8, fill_value=7, chunk_size=16)
+        self.dense = np.full(self.SHAPE, 7, dtype=np.uint8)
+
+    def assertDenseEqual(self):
+        np.testing.assert_array_equal(self.array.to_array(), self.dense)
+
+    def test_untouched(self):
+        self.assertEqual(self.array[50, 50], 7)
+        region = self.array[10:40, 5:20]
+        self.assertEqual(region.shape, (30, 15))
+        self.assertTrue(np.all(region == 7))
+        self.array[0:50, 0:50] = 7
+        self.assertEqual(self.array.nbytes, 0)
+
+    def test_positions(self):
+        self.array[17, 33] = 1
+        self.dense[17, 33] = 1
+        self.assertEqual(self.array[17, 33], 1)
+        self.assertEqual(len(self.array.chunks), 1)
+        with self.assertRaises(IndexError):
+            self.array[100, 0]
+        self.assertDenseEqual()
+
+    def test_slices(self):
+        values = np.arange(30*40, dtype=np.uint8).reshape(30, 40)
+        self.array[5:35, 20:60] = values
+        self.dense[5:35, 20:60] = values
+        self.assertDenseEqual()
+        np.testing.assert_array_equal(self.array[0:50, 10:], self.dense[0:50, 10:])
+        np.testing.assert_array_equal(self.array[90:120, 60:80], self.dense[90:120, 60:80])
+        self.assertEqual(len(self.array.chunks), 3*3)
+
+    def test_index_arrays(self):
+        xs = np.array([0, 20, 99, 50])
+        ys = np.array([0, 20, 69, 3])
+        self.array[xs, ys] = [1, 2, 3, 7]
+        self.dense[xs, ys] = [1, 2, 3, 7]
+        self.assertDenseEqual()
+        np.testing.assert_array_equal(self.array[xs, ys], [1, 2, 3, 7])
+        self.assertEqual(len(self.array.chunks), 3)
+
+    def test_or(self):
+        array = ChunkedArray(self.SHAPE, dtype=bool, fill_value=False, chunk_size=16)
+        mask = np.zeros(self.SHAPE, dtype=bool)
+        mask[40:45, 40:45] = True
+        array |= mask
+        self.assertEqual(len(array.chunks), 1)
+        window = np.ones((10, 10), dtype=bool)
+        array.or_region((-5, 65), window)
+        mask[0:5, 65:70] = True
+        np.testing.assert_array_equal(np.asarray(array), mask)
+
+    def test_or_at(self):
+        xs = np.array([20, 20, 99, 20])
+        ys = np.array([5, 5, 69, 6])
+        self.array.or_at((xs, ys), [8, 16, 8, 32])
+        self.dense[20, 5] |= 8 | 16
+        self.dense[99, 69] |= 8
+        self.dense[20, 6] |= 32
+        self.assertDenseEqual()
+
+    def test_view(self):
+        view = self.array.view(writeable=False)
+        self.array[17, 33] = 1
+        self.assertEqual(view[17, 33], 1)
+        with self.assertRaises(ValueError):
+            view[0, 0] = 1
+        with self.assertRaises(ValueError):
+            view[0:5, 0:5] = 1
+
+    def test_fill(self):
+        self.array[17, 33] = 1
+        self.array.fill(3)
+        self.assertEqual(self.array.nbytes, 0)
+        self.assertEqual(self.array[17, 33], 3)
+
+    def test_map_chunks(self):
+        other = ChunkedArray(self.SHAPE, dtype=np.uint8, fill_value=1, chunk_size=16)
+        other[50:60, 50:60] = 2
+        self.array[0:10, 0:10] = 3
+        self.dense[0:10, 0:10] = 3
+        mapped = map_chunks(lambda a, b: a + b == 8, self.array, other, dtype=bool)
+        self.assertTrue(mapped.fill_value)
+        np.testing.assert_array_equal(np.asarray(mapped), self.dense + np.asarray(other) == 8)
+        # Chunks equal to fill_value are not allocated
+        self.array[90:, 60:] = 7
+        mapped = map_chunks(lambda a: a == 7, self.array, dtype=bool)
+        self.assertEqual(len(mapped.chunks), 1)
@@ -0,0 +1,396 @@
+import unittest
+import uuid
+
+from rogal.ecs import ECS, System, RunState
+from rogal.ecs.core import ComponentManager, ColumnarComponentManager, EntityIdAllocator
+from rogal.ecs.components import Counter, Int
+
+from rogal.actions_queue import ActionsQueue
+from rogal.fov import FOVCalculator
+from rogal.spatial.buckets import BucketsIndex
+from rogal.spatial.spatial_index import SpatialIndex
+from rogal import components
+from rogal import systems
+from rogal import dtypes
+
+
+Value = Int('Value')
+Waits = Counter('Waits', dtype=dtypes.COUNTER_DT)
+
+
+class ColumnarComponentManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ecs = ECS()
+        self.manager = self.ecs.manage(Waits)
+
+    def test_manage(self):
+        self.assertIsInstance(self.manager, ColumnarComponentManager)
+        self.assertNotIsInstance(self.ecs.manage(Value), ColumnarComponentManager)
+        self.assertIsInstance(self.ecs.manage(Value), ComponentManager)
+
+    def test_insert_get(self):
+        entities = [self.ecs.create() for i in range(100)]
+        for value, entity in enumerate(entities):
+            self.manager.insert(entity, value)
+        self.assertEqual(len(self.manager), 100)
+        for value, entity in enumerate(entities):
+            self.assertIn(entity, self.manager)
+            self.assertEqual(self.manager.get(entity), value)
+        self.manager.insert(entities[0], 42)
+        self.assertEqual(self.manager.get(entities[0]), 42)
+        self.assertEqual(len(self.manager), 100)
+
+    def test_discard(self):
+        entities = [self.ecs.create() for i in range(10)]
+        for value, entity in enumerate(entities):
+            self.manager.insert(entity, value)
+        self.manager.discard(entities[0])
+        self.manager.discard(entities[5])
+        self.manager.discard(entities[-1])
+        self.assertEqual(len(self.manager), 7)
+        self.assertIsNone(self.manager.get(entities[0]))
+        for value, entity in enumerate(entities[1:-1], start=1):
+            if value == 5:
+                continue
+            self.assertEqual(self.manager.get(entity), value)
+        self.assertEqual(
+            dict((entity, int(component)) for entity, component in self.manager),
+            {entity: value for value, entity in enumerate(entities) if value not in {0, 5, 9}}
+        )
+
+    def test_column(self):
+        entities = [self.ecs.create(Waits(value)) for value in range(1, 5)]
+        wait_times = self.manager.column('value')
+        wait_times -= 2
+        self.assertEqual(
+            self.manager.entities_where(wait_times <= 0),
+            set(entities[:2])
+        )
+        self.assertEqual(self.manager.get(entities[-1]), 2)
+
+    def test_write_through(self):
+        first, second = [self.ecs.create(Waits(value)) for value in (5, 7)]
+        changes = self.manager.track_changes()
+        waits = self.manager.get(second)
+        waits -= 2
+        self.assertEqual(self.manager.get(second), 5)
+        self.assertEqual(changes.read().modified, {second})
+        # Slot of second entity is moved, view is still valid
+        self.manager.discard(first)
+        waits += 1
+        self.assertEqual(self.manager.get(second), 6)
+        self.assertEqual(self.manager.column('value').tolist(), [6])
+
+        hit_points_manager = self.ecs.manage(components.HitPoints)
+        hit_points_manager.insert(first, 10)
+        hit_points = hit_points_manager.get(first)
+        hit_points -= 3
+        self.assertEqual(int(hit_points_manager.get(first)), 7)
+        hit_points.value = 42
+        self.assertEqual(hit_points_manager.get(first).value, 10)
+        self.assertEqual(hit_points_manager.get(first).max_value, 10)
+
+    def test_remove_entity(self):
+        entity = self.ecs.create(Waits(1), Value(2))
+        self.ecs.remove(entity)
+        self.assertNotIn(entity, self.manager)
+        self.assertEqual(len(self.manager.column('value')), 0)
+
+
+class QueryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ecs = ECS()
+
+    def test_query(self):
+        both = self.ecs.create(Value(1), Waits(2))
+        only_value = self.ecs.create(Value(3))
+        query = self.ecs.query(Value, Waits)
+        self.assertIs(query, self.ecs.query(Value, Waits))
+        self.assertEqual(query.entities, {both})
+        self.assertEqual(list(query), [[both, 1, 2]])
+
+        self.ecs.manage(Waits).insert(only_value, 4)
+        self.assertEqual(query.entities, {both, only_value})
+
+        self.ecs.manage(Value).discard(both)
+        self.assertEqual(query.entities, {only_value})
+
+        self.ecs.remove(only_value)
+        self.assertEqual(len(query), 0)
+
+    def test_clear(self):
+        entities = [self.ecs.create(Value(i), Waits(i)) for i in range(5)]
+        query = self.ecs.query(Value, Waits)
+        self.assertEqual(len(query), 5)
+        self.ecs.manage(Value).clear()
+        self.assertEqual(len(query), 0)
+
+    def test_filter(self):
+        entities = [self.ecs.create(Value(i), Waits(i)) for i in range(5)]
+        query = self.ecs.query(Value, Waits)
+        self.assertEqual(
+            {entity for entity, *values in query.filter({entities[0], entities[1]})},
+            {entities[0], entities[1]},
+        )
+
+
+class EntityIdAllocatorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ecs = ECS()
+
+    def test_create(self):
+        entities = [self.ecs.create() for i in range(10)]
+        self.assertEqual(len(set(entities)), 10)
+        for entity in entities:
+            self.assertTrue(entity.is_compact)
+            self.assertGreaterEqual(entity.index, EntityIdAllocator.RESERVED)
+            self.assertEqual(entity.generation, 0)
+
+    def test_recycle(self):
+        entity = self.ecs.create(Value(1))
+        self.ecs.remove(entity)
+        recycled = self.ecs.create()
+        self.assertEqual(recycled.index, entity.index)
+        self.assertEqual(recycled.generation, entity.generation+1)
+        self.assertNotEqual(recycled, entity)
+        # Removing stale reference must not affect recycled Entity
+        self.ecs.remove(entity)
+        self.assertIn(recycled, self.ecs.entities)
+        self.assertEqual(self.ecs.create().index, entity.index+1)
+
+    def test_explicit_id(self):
+        entity = self.ecs.create(Value(1), entity_id=0x21)
+        self.assertEqual(entity, 0x21)
+        self.assertEqual(self.ecs.manage(Value).get(0x21), 1)
+        self.ecs.remove(entity)
+        self.assertNotEqual(self.ecs.create(), 0x21)
+
+    def test_uuid(self):
+        entity = self.ecs.create()
+        self.assertEqual(self.ecs.get_uuid(entity), self.ecs.get_uuid(entity))
+        level_uuid = uuid.uuid4()
+        level = self.ecs.create(entity_id=level_uuid)
+        self.assertEqual(self.ecs.get_uuid(level), level_uuid)
+
+
+class EntitiesIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ecs = ECS()
+
+    def test_get_components(self):
+        entity = self.ecs.create(Value(1), Waits(2))
+        other = self.ecs.create(Value(3))
+        self.assertEqual(self.ecs.get_components(entity), [1, 2])
+        self.assertEqual(self.ecs.get_components(other), [3])
+        self.ecs.manage(Value).discard(entity)
+        self.assertEqual(self.ecs.get_components(entity), [2])
+        self.ecs.manage(Waits).clear()
+        self.assertEqual(self.ecs.get_components(entity), [])
+        self.assertEqual(self.ecs.get_components(other), [3])
+
+    def test_remove(self):
+        entity = self.ecs.create(Value(1), Waits(2))
+        self.ecs.remove(entity)
+        self.assertEqual(self.ecs.get_components(entity), [])
+        self.assertNotIn(entity, self.ecs.manage(Value))
+        self.assertNotIn(entity, self.ecs.manage(Waits))
+
+
+class ChangesCursorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ecs = ECS()
+        self.manager = self.ecs.manage(Value)
+        self.cursor = self.manager.track_changes()
+
+    def test_changes(self):
+        entities = [self.ecs.create(Value(i)) for i in range(3)]
+        changes = self.cursor.read()
+        self.assertEqual(changes.added, set(entities))
+        self.assertFalse(changes.removed)
+        self.assertFalse(changes.modified)
+        self.assertFalse(self.cursor.read())
+
+        self.manager.insert(entities[0], 42)
+        self.manager.mark_modified(entities[1])
+        self.ecs.remove(entities[2])
+        changes = self.cursor.read()
+        self.assertEqual(changes.modified, {entities[0], entities[1]})
+        self.assertEqual(changes.removed, {entities[2]})
+        self.assertEqual(changes.changed, {entities[0], entities[1]})
+
+    def test_net_changes(self):
+        entity = self.ecs.create(Value(1))
+        self.manager.discard(entity)
+        self.assertFalse(self.cursor.read())
+
+        entity = self.ecs.create(Value(1))
+        self.cursor.read()
+        self.manager.discard(entity)
+        self.manager.insert(entity, 2)
+        changes = self.cursor.read()
+        self.assertEqual(changes.modified, {entity})
+        self.assertFalse(changes.added)
+        self.assertFalse(changes.removed)
+
+    def test_multiple_cursors(self):
+        other = self.manager.track_changes()
+        entity = self.ecs.create(Value(1))
+        self.assertEqual(self.cursor.read().added, {entity})
+        self.manager.clear()
+        self.assertEqual(self.cursor.read().removed, {entity})
+        self.assertFalse(other.read())
+
+
+class CommandsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ecs = ECS()
+
+    def test_commands(self):
+        entity = self.ecs.commands.create(Value(1))
+        self.assertNotIn(entity, self.ecs.entities)
+        other = self.ecs.create(Value(2))
+        self.ecs.commands.insert(entity, Waits, 3)
+        self.ecs.commands.remove(other, Value)
+        self.assertEqual(len(self.ecs.commands), 3)
+
+        self.ecs.commands.flush()
+        self.assertEqual(len(self.ecs.commands), 0)
+        self.assertIn(entity, self.ecs.entities)
+        self.assertEqual(self.ecs.get_components(entity), [1, 3])
+        self.assertEqual(self.ecs.get_components(other), [])
+
+        self.ecs.commands.destroy(entity, other)
+        self.assertIn(entity, self.ecs.entities)
+        self.ecs.commands.flush()
+        self.assertNotIn(entity, self.ecs.entities)
+        self.assertNotIn(other, self.ecs.entities)
+
+    def test_join_while_removing(self):
+        entities = [self.ecs.create(Value(i)) for i in range(10)]
+        for entity, value in self.ecs.join(self.ecs.entities, self.ecs.manage(Value)):
+            self.ecs.commands.destroy(entity)
+        self.ecs.commands.flush()
+        self.assertFalse(self.ecs.entities)
+
+
+class SystemsManagerTests(unittest.TestCase):
+
+    def test_schedules(self):
+        ecs = ECS()
+        runs = []
+
+        class TickingSystem(System):
+            INCLUDE_STATES = {RunState.TICKING, }
+            def run(self):
+                runs.append(self)
+
+        class NotRenderingSystem(System):
+            EXCLUDE_STATES = {RunState.RENDER, }
+            def run(self):
+                runs.append(self)
+
+        ticking = TickingSystem(ecs)
+        not_rendering = NotRenderingSystem(ecs)
+        ecs.register(not_rendering, ticking)
+        self.assertEqual(ecs._systems.schedules[RunState.TICKING], [not_rendering, ticking])
+        self.assertEqual(ecs._systems.schedules[RunState.RENDER], [])
+        self.assertEqual(ecs._systems.schedules[RunState.PRE_RUN], [not_rendering])
+
+        ecs.run_once()
+        self.assertEqual(runs, [not_rendering])
+        ecs.run_state = RunState.TICKING
+        ecs.run_once()
+        ecs.run_once()
+        self.assertEqual(runs, [not_rendering, not_rendering, not_rendering, ticking])
+
+class ParallelSystemsManagerTests(unittest.TestCase):
+
+    def test_stages(self):
+        ecs = ECS(max_workers=2)
+        runs = []
+
+        def system_type(reads, writes):
+            class DeclaredSystem(System):
+                INCLUDE_STATES = {RunState.TICKING, }
+                READS = reads
+                WRITES = writes
+                def run(self):
+                    runs.append(self)
+            return DeclaredSystem
+
+        writes_value = system_type({Value, }, {Value, })(ecs)
+        writes_waits = system_type({Waits, }, {Waits, })(ecs)
+        reads_value = system_type({Value, }, set())(ecs)
+        reads_both = system_type({Value, Waits, }, set())(ecs)
+        undeclared = system_type(None, None)(ecs)
+        ecs.register(writes_value, writes_waits, reads_value, undeclared, reads_both)
+        self.assertEqual(
+            ecs._systems.stages[RunState.TICKING],
+            [[writes_value, writes_waits], [reads_value], [undeclared], [reads_both]],
+        )
+
+        ecs.run_state = RunState.TICKING
+        ecs.run_once()
+        ecs.run_once()
+        self.assertEqual(len(runs), 5)
+        self.assertEqual(set(runs[:2]), {writes_value, writes_waits})
+        self.assertEqual(runs[2:], [reads_value, undeclared, reads_both])
+
+    def test_undeclared_reads(self):
+        ecs = ECS(max_workers=2)
+
+        class WritesValue(System):
+            INCLUDE_STATES = {RunState.TICKING, }
+            READS = {Value, }
+            WRITES = {Value, }
+
+        class UndeclaredReads(System):
+            INCLUDE_STATES = {RunState.TICKING, }
+            READS = None
+            WRITES = set()
+
+        writes_value = WritesValue(ecs)
+        undeclared_reads = UndeclaredReads(ecs)
+        ecs.register(writes_value, undeclared_reads)
+        self.assertEqual(
+            ecs._systems.stages[RunState.TICKING],
+            [[writes_value], [undeclared_reads]],
+        )
+
+    def test_commands_writes(self):
+        ecs = ECS(max_workers=2)
+
+        class ReadsBlocksVision(System):
+            INCLUDE_STATES = {RunState.PERFOM_ACTIONS, }
+            READS = {components.BlocksVision, }
+            WRITES = set()
+
+        # NOTE: Changes made by OperateSystem using ecs.commands must be applied before readers run
+        operate = systems.actions.OperateSystem(ecs)
+        reads_blocks_vision = ReadsBlocksVision(ecs)
+        ecs.register(operate, reads_blocks_vision)
+        self.assertEqual(
+            ecs._systems.stages[RunState.PERFOM_ACTIONS],
+            [[operate], [reads_blocks_vision]],
+        )
+
+    def test_resources_writes(self):
+        ecs = ECS(max_workers=2)
+        ecs.resources.spatial = SpatialIndex(ecs)
+        ecs.resources.actions_queue = ActionsQueue(ecs)
+        ecs.resources.fov = FOVCalculator()
+        ecs.resources.viewsheds_index = BucketsIndex()
+
+        # NOTE: Both query SpatialIndex, which builds its caches on demand
+        dormancy = systems.actions.DormancySystem(ecs)
+        visibility = systems.awerness.VisibilitySystem(ecs)
+        ecs.register(dormancy, visibility)
+        for run_state in [RunState.PRE_RUN, RunState.PERFOM_ACTIONS]:
+            self.assertEqual(ecs._systems.stages[run_state], [[dormancy], [visibility]])
+
@@ -0,0 +1,111 @@
+import unittest
+
+import numpy as np
+
+from rogal import fov
+from rogal.geometry import Position
+
+
+class FOVTests(unittest.TestCase):
+
+    SIZE = (40, 30)
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.transparency = rng.random(self.SIZE) > 0.25
+        self.positions = [
+            Position(int(x), int(y))
+            for x, y in zip(rng.integers(self.SIZE[0], size=50), rng.integers(self.SIZE[1], size=50))
+        ]
+
+    def project(self, fov_offset):
+        level_fov = np.zeros(self.SIZE, dtype=bool)
+        window, offset = fov_offset
+        width, height = window.shape
+        level_fov[offset.x:offset.x+width, offset.y:offset.y+height] = window
+        return level_fov
+
+    def test_windowed(self):
+        for algorithm, compute in fov.ALGORITHMS.items():
+            for position in self.positions[:10]:
+                window, offset = fov.compute_fov(self.transparency, position, 6, algorithm)
+                self.assertTrue(all(dim <= 2*6+1 for dim in window.shape))
+                np.testing.assert_array_equal(
+                    self.project((window, offset)),
+                    compute(self.transparency, position, 6),
+                )
+
+    def test_symmetric_shadowcast(self):
+        compute = fov.compute_symmetric_shadowcast
+        transparency = np.ones((9, 9), dtype=bool)
+        self.assertTrue(compute(transparency, (4, 4), 0).all())
+        dx, dy = np.mgrid[-4:5, -4:5]
+        np.testing.assert_array_equal(compute(transparency, (4, 4), 4), dx*dx + dy*dy < 16)
+
+        # Symmetric - if floor tile is visible from another floor tile, it works both ways
+        fovs = {position: compute(self.transparency, position, 0) for position in self.positions}
+        for position, position_fov in fovs.items():
+            if not self.transparency[position]:
+                continue
+            for other, other_fov in fovs.items():
+                if self.transparency[other]:
+                    self.assertEqual(position_fov[other], other_fov[position])
+
+    def test_compute_many(self):
+        viewers = [(position, radius) for position in self.positions for radius in (0, 5, 8)]
+        expected = fov.FOVCalculator().compute_many(self.transparency, viewers)
+        calculator = fov.FOVCalculator('restrictive', max_workers=4)
+        for (window, offset), (expected_window, expected_offset) in zip(
+            calculator.compute_many(self.transparency, viewers), expected
+        ):
+            self.assertEqual(offset, expected_offset)
+            np.testing.assert_array_equal(window, expected_window)
+        with self.assertRaises(ValueError):
+            fov.FOVCalculator('unknown')
+
+
+class FOVCacheTests(unittest.TestCase):
+
+    def test_lru(self):
+        cache = fov.FOVCache(max_bytes=3*(100+2))
+        for i in range(3):
+            cache.put((i, b'ab'), (np.zeros((10, 10), dtype=bool), Position(i, i)))
+        self.assertEqual(cache.nbytes, 3*102)
+        self.assertIsNotNone(cache.get((0, b'ab')))
+        cache.put((3, b'ab'), (np.zeros((10, 10), dtype=bool), Position(3, 3)))
+        self.assertEqual(len(cache), 3)
+        # Least recently used was evicted
+        self.assertIsNone(cache.get((1, b'ab')))
+        window, offset = cache.get((0, b'ab'))
+        self.assertEqual(offset, Position(0, 0))
+        self.assertFalse(window.flags.writeable)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        cache.clear()
+        self.assertEqual((len(cache), cache.nbytes), (0, 0))
+
+    def test_calculator(self):
+        transparency = np.ones((40, 30), dtype=bool)
+        viewers = [(Position(10, 10), 5), (Position(30, 20), 5), (Position(10, 10), 5)]
+        calculator = fov.FOVCalculator(cache_size=1024*1024)
+        first = calculator.compute_many(transparency, viewers, 'level')
+        self.assertEqual((calculator.cache.hits, calculator.cache.misses), (0, 3))
+        self.assertEqual(len(calculator.cache), 2)
+        self.assertIs(first[0][0], first[2][0])
+
+        # Changes outside FOV windows
+        transparency[0, 0] = False
+        second = calculator.compute_many(transparency, viewers, 'level')
+        self.assertEqual(calculator.cache.hits, 3)
+        for (window, offset), (first_window, first_offset) in zip(second, first):
+            self.assertIs(window, first_window)
+
+        # Change inside FOV window of the first viewer
+        transparency[12, 10] = False
+        third = calculator.compute_many(transparency, viewers, 'level')
+        self.assertEqual((calculator.cache.hits, calculator.cache.misses), (4, 5))
+        # Position behind the wall
+        self.assertFalse(third[0][0][8, 5])
+        transparency[12, 10] = True
+        calculator.compute_many(transparency, viewers, 'level')
+        self.assertEqual(calculator.cache.hits, 7)
+
@@ -0,0 +1,140 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import unittest
+
+from rogal.utils.perf import Histogram, Perf, Tracer
+
+
+class HistogramTests(unittest.TestCase):
+
+    def test_buckets(self):
+        previous = -1
+        for value in range(10_000):
+            index = Histogram.bucket_index(value)
+            self.assertGreaterEqual(index, previous)
+            lowest, highest = Histogram.bucket_range(index)
+            self.assertLessEqual(lowest, value)
+            self.assertGreaterEqual(highest, value)
+            previous = index
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        rng = random.Random(42)
+        values = [rng.randint(1_000, 50_000_000) for i in range(10_000)]
+        for value in values:
+            histogram.add(value)
+        values.sort()
+        self.assertEqual(len(histogram), len(values))
+        self.assertEqual(histogram.max, values[-1])
+        self.assertEqual(histogram.min, values[0])
+        for percentile in [50, 95, 99]:
+            expected = values[len(values)*percentile//100 - 1]
+            self.assertAlmostEqual(
+                histogram.percentile(percentile) / expected, 1.0,
+                delta=1/Histogram.SUB_BUCKETS,
+            )
+        self.assertLess(len(histogram.counts), 300)
+
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.avg)
+
+
+class PerfTests(unittest.TestCase):
+
+    def setUp(self):
+        Perf.reset()
+
+    def tearDown(self):
+        Perf.enable()
+        Perf.reset()
+
+    def test_stats(self):
+        for i in range(10):
+            with Perf('test'):
+                pass
+        stats = Perf.get_stats('test')
+        self.assertEqual(stats['calls'], 10)
+        self.assertLessEqual(stats['p50'], stats['max'])
+        self.assertIn('test', Perf.get_stats())
+
+    def test_threads(self):
+        def record():
+            for i in range(1000):
+                with Perf('threads'):
+                    pass
+        threads = [threading.Thread(target=record) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(Perf.get_stats('threads')['calls'], 8*1000)
+
+    def test_disable(self):
+        Perf.disable()
+        with Perf('disabled'):
+            pass
+        self.assertIsNone(Perf.get_stats('disabled'))
+        Perf.enable()
+        with Perf('disabled'):
+            pass
+        self.assertEqual(Perf.get_stats('disabled')['calls'], 1)
+
+    def test_dump(self):
+        with Perf('test'):
+            pass
+        with tempfile.TemporaryDirectory() as path:
+            fn = os.path.join(path, 'perf.json')
+            Perf.dump(fn)
+            with open(fn) as f:
+                self.assertEqual(json.load(f)['test']['calls'], 1)
+
+
+class TracerTests(unittest.TestCase):
+
+    def setUp(self):
+        Perf.reset()
+
+    def tearDown(self):
+        Tracer.disable()
+        Perf.reset()
+
+    def test_frames(self):
+        Tracer.enable(max_frames=3)
+        for frame in range(5):
+            with Tracer.frame(run_state='TICKING'):
+                with Perf('outer'):
+                    with Perf('inner'):
+                        pass
+        events = Tracer.get_events()
+        self.assertEqual(len(Tracer.frames), 3)
+        self.assertEqual(len(events), 3*3)
+        inner, outer = events[1:3]
+        self.assertEqual(inner['name'], 'inner')
+        self.assertEqual(outer['name'], 'outer')
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts']+outer['dur'], inner['ts']+inner['dur'])
+        self.assertEqual(inner['args'], {'run_state': 'TICKING'})
+        self.assertTrue(all(event['ph'] == 'X' for event in events))
+
+    def test_slow_frame(self):
+        with tempfile.TemporaryDirectory() as path:
+            fn = os.path.join(path, 'trace-{frame}.json')
+            Tracer.enable(slow_frame=0.000_000_001, dump_fn=fn)
+            with Tracer.frame():
+                with Perf('slow'):
+                    sum(range(1000))
+            with open(fn.format(frame=Tracer.frames_count)) as f:
+                trace = json.load(f)
+            self.assertIn('slow', {event['name'] for event in trace['traceEvents']})
+
+    def test_disabled(self):
+        with Tracer.frame():
+            with Perf('test'):
+                pass
+        self.assertFalse(Tracer.frames)
+
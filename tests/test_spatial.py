@@ -0,0 +1,341 @@
+import unittest
+import uuid
+
+import numpy as np
+
+from rogal.bitmask import bitmask_8bit
+from rogal.ecs import ECS
+from rogal.flags import Flag
+from rogal.geometry import Direction, Position, Size
+from rogal.geometry.rectangle import Rectangle
+from rogal.spatial.buckets import BucketsIndex
+from rogal.spatial.occupancy import OccupancyGrid
+from rogal.spatial.spatial_index import SpatialIndex, EXITS_LOOKUP
+from rogal import components
+
+
+class SpatialIndexTests(unittest.TestCase):
+
+    SIZE = Size(20, 10)
+
+    def setUp(self):
+        self.ecs = ECS()
+        self.spatial = SpatialIndex(self.ecs)
+        terrain = self.spatial.init_terrain(self.SIZE)
+        self.level_id = self.spatial.create_level(uuid.uuid4(), 0, terrain)
+
+    def create(self, position, *flags):
+        location = components.Location(self.level_id, position)
+        entity = self.ecs.create(location, *flags)
+        self.spatial.add_entity(entity, location)
+        return entity
+
+    def test_entities_flags(self):
+        wall = self.create(Position(1, 1), components.BlocksMovement, components.BlocksVision)
+        first = self.create(Position(2, 1), components.BlocksMovement)
+        second = self.create(Position(2, 1), components.BlocksMovement)
+        self.create(Position(3, 1))
+
+        expected = np.zeros(self.SIZE, dtype=bool)
+        expected[1, 1] = expected[2, 1] = True
+        entities_flags = self.spatial.entities_flags(self.level_id)
+        np.testing.assert_array_equal(np.asarray(entities_flags) & Flag.BLOCKS_MOVEMENT > 0, expected)
+        np.testing.assert_array_equal(
+            entities_flags,
+            self.spatial.calculate_entities_flags(self.level_id),
+        )
+        self.assertEqual(entities_flags[1, 1], Flag.BLOCKS_MOVEMENT | Flag.BLOCKS_VISION)
+
+    def test_update_entities(self):
+        first = self.create(Position(2, 1), components.BlocksMovement)
+        second = self.create(Position(2, 1), components.BlocksMovement)
+        third = self.create(Position(5, 5), components.BlocksVision)
+
+        locations = self.ecs.manage(components.Location)
+        moves = []
+        for entity, position in [(first, Position(3, 1)), (third, Position(5, 6))]:
+            location = locations.get(entity)
+            moves.append((entity, location, location.position))
+            location.position = position
+        self.spatial.update_entities(moves)
+
+        entities_flags = self.spatial.entities_flags(self.level_id)
+        np.testing.assert_array_equal(
+            entities_flags,
+            self.spatial.calculate_entities_flags(self.level_id),
+        )
+        # Second entity is still there
+        self.assertEqual(entities_flags[2, 1], Flag.BLOCKS_MOVEMENT)
+        self.assertEqual(entities_flags[3, 1], Flag.BLOCKS_MOVEMENT)
+        self.assertEqual(entities_flags[5, 5], 0)
+        self.assertEqual(entities_flags[5, 6], Flag.BLOCKS_VISION)
+        self.assertEqual(self.spatial.get_entities(locations.get(first)), {first})
+
+        self.spatial.remove_entity(second, locations.get(second))
+        self.assertEqual(entities_flags[2, 1], 0)
+
+    def test_masks(self):
+        door = self.create(Position(2, 1), components.BlocksMovement, components.BlocksVision)
+        transparent = self.spatial.transparent(self.level_id)
+        walkable = self.spatial.walkable(self.level_id)
+        self.assertIs(transparent.chunks, self.spatial.transparent(self.level_id).chunks)
+        with self.assertRaises(ValueError):
+            transparent[0, 0] = False
+        self.assertFalse(transparent[2, 1])
+        self.assertFalse(walkable[2, 1])
+
+        version = self.spatial.version(self.level_id, 'transparent')
+        revealable = self.spatial.revealable(self.level_id)
+        self.assertIs(revealable, self.spatial.revealable(self.level_id))
+
+        # Opening door
+        self.ecs.manage(components.BlocksVision).discard(door)
+        self.spatial.update_entity(door, self.ecs.manage(components.Location).get(door))
+        self.assertTrue(self.spatial.has_changed(self.level_id, 'transparent', version))
+        self.assertTrue(transparent[2, 1])
+        self.assertFalse(walkable[2, 1])
+        self.assertIsNot(revealable, self.spatial.revealable(self.level_id))
+
+        version = self.spatial.version(self.level_id, 'walkable')
+        self.spatial.update_entity(door, self.ecs.manage(components.Location).get(door))
+        self.assertFalse(self.spatial.has_changed(self.level_id, 'walkable', version))
+
+    def test_set_terrain(self):
+        wall = 42
+        self.ecs.manage(components.BlocksMovement).insert(wall)
+        walkable = self.spatial.walkable(self.level_id)
+        self.spatial.set_terrain(self.level_id, [Position(3, 3), Position(4, 3)], wall)
+        self.assertFalse(walkable[3, 3])
+        self.assertFalse(walkable[4, 3])
+        np.testing.assert_array_equal(
+            self.spatial.terrain_flags(self.level_id),
+            self.spatial.calculate_terrain_flags(self.level_id),
+        )
+        np.testing.assert_array_equal(
+            walkable,
+            self.spatial.calculate_mask(self.level_id, 'walkable'),
+        )
+
+    def test_exits(self):
+        location = components.Location(self.level_id, Position(0, 0))
+        self.assertEqual(
+            self.spatial.get_exits(location),
+            {Direction.E, Direction.S, Direction.SE},
+        )
+
+        wall = self.create(Position(1, 1), components.BlocksMovement)
+        location = components.Location(self.level_id, Position(2, 2))
+        self.assertEqual(
+            self.spatial.get_exits(location),
+            set(Direction) - {Direction.NW, },
+        )
+        self.ecs.manage(components.BlocksMovement).discard(wall)
+        self.spatial.update_entity(wall, self.ecs.manage(components.Location).get(wall))
+        self.assertEqual(self.spatial.get_exits(location), set(Direction))
+
+        self.create(Position(5, 5), components.BlocksMovement)
+        self.create(Position(19, 9), components.BlocksMovement)
+        np.testing.assert_array_equal(
+            self.spatial.exits(self.level_id),
+            bitmask_8bit(self.spatial.walkable(self.level_id), pad_value=False),
+        )
+
+        positions = [Position(0, 0), Position(2, 2), Position(4, 4)]
+        bitmasks = self.spatial.get_exits_bitmasks(self.level_id, positions)
+        for position, exits_bitmask in zip(positions, bitmasks):
+            location = components.Location(self.level_id, position)
+            self.assertEqual(EXITS_LOOKUP[exits_bitmask], self.spatial.get_exits(location))
+
+    def test_chunks(self):
+        size = Size(1000, 1000)
+        rock, floor = 42, 43
+        self.ecs.manage(components.BlocksMovement).insert(rock)
+        self.ecs.manage(components.BlocksVision).insert(rock)
+        terrain = self.spatial.init_terrain(size)
+        terrain.fill(rock)
+        terrain[100:110, 200:205] = floor
+        level_id = self.spatial.create_level(uuid.uuid4(), 1, terrain)
+        location = components.Location(level_id, Position(500, 500))
+        self.spatial.add_entity(self.ecs.create(location, components.BlocksMovement), location)
+
+        # Only chunks with room and entity are allocated
+        self.assertEqual(len(terrain.chunks), 1)
+        self.assertEqual(len(self.spatial.terrain_flags(level_id).chunks), 1)
+        self.assertEqual(len(self.spatial.entities_flags(level_id).chunks), 1)
+        walkable = self.spatial.walkable(level_id)
+        self.assertEqual(len(walkable.chunks), 1)
+        self.assertTrue(walkable[105, 202])
+        self.assertFalse(walkable[500, 500])
+        self.assertFalse(walkable[900, 900])
+        self.assertEqual(
+            self.spatial.get_exits(components.Location(level_id, Position(100, 200))),
+            {Direction.E, Direction.S, Direction.SE},
+        )
+
+    def test_unload_levels(self):
+        self.spatial.cached_levels = 2
+        levels = [self.level_id, ] + [
+            self.spatial.create_level(uuid.uuid4(), depth, self.spatial.init_terrain(self.SIZE))
+            for depth in range(1, 3)
+        ]
+        self.create(Position(1, 1), components.BlocksMovement)
+        walkable = np.asarray(self.spatial.walkable(self.level_id))
+        self.spatial.exits(self.level_id)
+        nbytes = self.spatial.cached_nbytes(self.level_id)
+        self.assertGreater(nbytes, 0)
+
+        self.spatial.walkable(levels[1])
+        self.spatial.walkable(self.level_id)
+        self.spatial.walkable(levels[2])
+        # Least recently used level was unloaded
+        self.assertEqual(self.spatial.cached_nbytes(levels[1]), 0)
+        self.assertEqual(self.spatial.cached_nbytes(self.level_id), nbytes)
+
+        self.assertEqual(self.spatial.unload_level(self.level_id), nbytes)
+        self.assertEqual(self.spatial.cached_nbytes(self.level_id), 0)
+        # Rebuilt on demand
+        np.testing.assert_array_equal(self.spatial.walkable(self.level_id), walkable)
+
+    def test_unload_grid(self):
+        monster = self.create(Position(1, 1), components.BlocksMovement)
+        grid_nbytes = self.spatial.grid(self.level_id).nbytes
+        self.assertGreaterEqual(self.spatial.cached_nbytes(self.level_id), grid_nbytes)
+
+        self.spatial.unload_level(self.level_id)
+        self.assertNotIn(self.level_id, self.spatial._grids)
+        # Rebuilt from Locations, also when entity is moved while grid is unloaded
+        locations = self.ecs.manage(components.Location)
+        location = locations.get(monster)
+        location.position = Position(2, 2)
+        self.spatial.update_entity(monster, location, Position(1, 1))
+        self.assertEqual(self.spatial.get_entities(location), {monster, })
+        self.assertFalse(self.spatial.get_entities(location, Position(1, 1)))
+
+    def test_destroy_level(self):
+        memory = components.LevelMemory()
+        fov = np.zeros(self.SIZE, dtype=bool)
+        fov[0:5, 0:5] = True
+        memory.update(self.level_id, self.SIZE, fov)
+        self.ecs.create(memory)
+        monster = self.create(Position(1, 1), components.BlocksMovement)
+        self.spatial.walkable(self.level_id)
+
+        nbytes = self.spatial.destroy_level(self.level_id)
+        self.assertGreater(nbytes, self.spatial.init_terrain(self.SIZE).nbytes)
+        self.assertIsNone(self.spatial.get_level(self.level_id))
+        self.assertNotIn(monster, self.ecs.entities)
+        self.assertNotIn(self.level_id, memory.revealed)
+        self.assertFalse(self.spatial.entities(self.level_id))
+        self.assertEqual(self.spatial.cached_nbytes(self.level_id), 0)
+
+
+class OccupancyGridTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ecs = ECS()
+        self.grid = OccupancyGrid(Size(10, 10))
+
+    def test_add_discard(self):
+        first, second, third = [self.ecs.create() for i in range(3)]
+        position = Position(2, 3)
+        self.assertEqual(self.grid.get(position), set())
+
+        self.grid.add(first, position)
+        self.grid.add(first, position)
+        self.assertEqual(self.grid.get(position), {first})
+        self.grid.add(second, position)
+        self.grid.add(third, position)
+        self.assertEqual(self.grid.get(position), {first, second, third})
+        self.assertEqual(self.grid.count(position), 3)
+
+        self.grid.discard(second, position)
+        self.grid.discard(second, position)
+        self.assertEqual(self.grid.get(position), {first, third})
+        self.grid.discard(first, position)
+        self.assertEqual(self.grid.get(position), {third})
+        self.assertFalse(self.grid.overflow)
+        self.grid.discard(third, position)
+        self.assertEqual(self.grid.count(position), 0)
+        self.assertEqual(self.grid.get(Position(5, 5)), set())
+        self.assertEqual(self.grid.count(Position(5, 5)), 0)
+
+    def test_outside(self):
+        first, second = [self.ecs.create() for i in range(2)]
+        self.grid.add(first, Position(9, 2))
+        self.grid.add(first, Position(0, 2))
+        self.grid.add(second, Position(0, 2))
+        for position in [Position(-1, 2), Position(10, 2), Position(0, -1), Position(0, 10)]:
+            self.assertEqual(self.grid.get(position), set())
+            self.assertEqual(self.grid.count(position), 0)
+
+        # Returned sets are copies, not internal overflow sets
+        self.grid.get(Position(0, 2)).discard(first)
+        self.assertEqual(self.grid.get(Position(0, 2)), {first, second})
+
+    def test_queries(self):
+        entities = [self.ecs.create() for i in range(4)]
+        self.grid.add(entities[0], Position(1, 1))
+        self.grid.add(entities[1], Position(5, 5))
+        self.grid.add(entities[2], Position(5, 5))
+        self.grid.add(entities[3], Position(8, 2))
+
+        rect = Rectangle(Position(0, 0), Size(6, 6))
+        self.assertEqual(set(self.grid.query_rect(rect).tolist()), set(entities[:3]))
+        rect = Rectangle(Position(-5, -5), Size(7, 7))
+        self.assertEqual(set(self.grid.query_rect(rect).tolist()), {entities[0]})
+
+        mask = np.zeros((10, 10), dtype=bool)
+        mask[5, 5] = mask[8, 2] = True
+        self.assertEqual(set(self.grid.query_mask(mask).tolist()), set(entities[1:]))
+        # Mask covering only part of the grid, partially outside
+        mask = np.ones((6, 6), dtype=bool)
+        mask[0, 0] = False
+        self.assertEqual(set(self.grid.query_mask(mask, Position(5, -2)).tolist()), {entities[3]})
+        self.assertEqual(set(self.grid.query_mask(mask, Position(-4, -4)).tolist()), {entities[0]})
+        self.assertEqual(set(self.grid.query_mask(mask, Position(5, 5)).tolist()), set())
+
+        self.assertEqual(set(self.grid.query_radius(Position(3, 3), 2).tolist()), set())
+        self.assertEqual(set(self.grid.query_radius(Position(3, 3), 3).tolist()), set(entities[:3]))
+        self.assertEqual(set(self.grid.query_radius(Position(9, 2), 1).tolist()), {entities[3]})
+
+    def test_non_compact(self):
+        entity = self.ecs.create(entity_id=uuid.uuid4())
+        with self.assertRaises(ValueError):
+            self.grid.add(entity, Position(1, 1))
+
+
+class BucketsIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ecs = ECS()
+        self.index = BucketsIndex(bucket_size=8)
+
+    def query(self, level_id, *positions):
+        xs, ys = np.array(positions).T
+        return self.index.query(level_id, (xs, ys))
+
+    def test_query(self):
+        first, second, third = [self.ecs.create() for i in range(3)]
+        self.index.update(first, 'level', 0, 0, 10, 10)
+        self.index.update(second, 'level', 5, 5, 30, 20)
+        self.index.update(third, 'other', 0, 0, 10, 10)
+
+        self.assertEqual(self.query('level', (1, 1)), {first})
+        self.assertEqual(self.query('level', (7, 7)), {first, second})
+        # Same bucket, but outside of area
+        self.assertEqual(self.query('level', (11, 11)), {second})
+        self.assertEqual(self.query('level', (10, 2)), set())
+        self.assertEqual(self.query('level', (1, 1), (29, 19)), {first, second})
+        self.assertEqual(self.query('missing', (1, 1)), set())
+
+        self.index.update(first, 'level', 20, 20, 30, 30)
+        self.assertEqual(self.query('level', (1, 1)), set())
+        self.assertEqual(self.query('level', (25, 25)), {first})
+
+        self.index.remove(second)
+        self.index.remove(second)
+        self.assertEqual(self.query('level', (7, 7)), set())
+        self.index.remove(third)
+        self.assertNotIn('other', self.index._buckets)
+        self.assertEqual(len(self.index), 1)
+
@@ -0,0 +1,114 @@
+import unittest
+import uuid
+
+import numpy as np
+import tcod
+import tcod.map
+
+from rogal.ecs import ECS
+from rogal.fov import FOVCalculator
+from rogal.geometry import Position, Size
+from rogal.geometry.rectangle import Rectangle
+from rogal.spatial.buckets import BucketsIndex
+from rogal.spatial.spatial_index import SpatialIndex
+from rogal.systems.awerness import InvalidateViewshedsSystem, VisibilitySystem
+from rogal import components
+
+
+class VisibilitySystemTests(unittest.TestCase):
+
+    SIZE = Size(60, 40)
+
+    def setUp(self):
+        self.ecs = ECS()
+        self.spatial = SpatialIndex(self.ecs)
+        self.ecs.resources.spatial = self.spatial
+        self.ecs.resources.fov = FOVCalculator()
+        self.ecs.resources.viewsheds_index = BucketsIndex()
+        terrain = self.spatial.init_terrain(self.SIZE)
+        self.level_id = self.spatial.create_level(uuid.uuid4(), 0, terrain)
+        self.system = VisibilitySystem(self.ecs)
+
+        rng = np.random.default_rng(42)
+        for x, y in zip(rng.integers(self.SIZE.width, size=300), rng.integers(self.SIZE.height, size=300)):
+            self.create(Position(int(x), int(y)), components.BlocksVision)
+
+    def create(self, position, *args):
+        location = components.Location(self.level_id, position)
+        entity = self.ecs.create(location, *args)
+        self.spatial.add_entity(entity, location)
+        return entity
+
+    def full_fov(self, position, radius):
+        return tcod.map.compute_fov(
+            transparency=self.spatial.transparent(self.level_id),
+            pov=position,
+            radius=radius,
+            light_walls=True,
+            algorithm=tcod.FOV_RESTRICTIVE,
+        )
+
+    def test_windowed_fov(self):
+        memory = components.LevelMemory()
+        viewers = {}
+        for position in [Position(30, 20), Position(2, 3), Position(59, 39)]:
+            viewers[position] = self.create(position, components.Viewshed(8), memory)
+        self.system.update_viewsheds()
+
+        viewsheds = self.ecs.manage(components.Viewshed)
+        revealed = np.zeros(self.SIZE, dtype=bool)
+        for position, entity in viewers.items():
+            viewshed = viewsheds.get(entity)
+            self.assertTrue(all(dim <= 2*8+1 for dim in viewshed.fov.shape))
+            fov = self.full_fov(position, 8)
+            np.testing.assert_array_equal(viewshed.project(self.SIZE), fov)
+            for coverage in [
+                Rectangle(Position(0, 0), Size(20, 15)),
+                Rectangle(Position(25, 10), Size(35, 30)),
+                Rectangle(Position(50, 35), Size(10, 5)),
+            ]:
+                np.testing.assert_array_equal(
+                    viewshed.covered(coverage),
+                    fov[coverage.x:coverage.x2, coverage.y:coverage.y2],
+                )
+            xs, ys = viewshed.positions
+            self.assertEqual(set(zip(xs.tolist(), ys.tolist())), set(zip(*fov.nonzero())))
+            index = (np.array([position.x, (position.x+5) % 60, 0, 59]), np.array([position.y, 0, 0, 39]))
+            np.testing.assert_array_equal(viewshed.visible(index), fov[index])
+            for x, y in zip(*index):
+                self.assertEqual(viewshed.is_visible(Position(x, y)), fov[x, y])
+            revealed |= fov
+        self.assertEqual(viewsheds.get(viewers[Position(30, 20)]).offset, Position(22, 12))
+        self.assertEqual(viewsheds.get(viewers[Position(2, 3)]).offset, Position(0, 0))
+        np.testing.assert_array_equal(memory.revealed[self.level_id].to_array(), revealed)
+
+    def test_invalidate_on_blocks_vision_changed(self):
+        invalidate_system = InvalidateViewshedsSystem(self.ecs)
+        viewsheds_index = self.ecs.resources.viewsheds_index
+        near = self.create(Position(10, 10), components.Viewshed(6))
+        far = self.create(Position(50, 30), components.Viewshed(6))
+        removed = self.create(Position(12, 10), components.Viewshed(6))
+        invalidate_system.run()
+        self.system.update_viewsheds()
+        viewsheds = self.ecs.manage(components.Viewshed)
+        self.assertFalse(viewsheds.get(near).needs_update)
+        self.assertEqual(len(viewsheds_index), 3)
+
+        viewsheds.remove(far)
+        invalidate_system.run()
+        self.assertNotIn(far, viewsheds_index)
+
+        door = self.create(Position(10, 11))
+        viewsheds.remove(removed)
+        self.ecs.manage(components.BlocksVision).insert(door)
+        invalidate_system.on_blocks_vision_changed()
+        self.assertTrue(viewsheds.get(near).needs_update)
+        self.assertNotIn(removed, viewsheds_index)
+
+        viewsheds.insert(far, 6)
+        self.system.update_viewsheds()
+        self.ecs.manage(components.BlocksVision).remove(door)
+        invalidate_system.on_blocks_vision_changed()
+        self.assertTrue(viewsheds.get(near).needs_update)
+        self.assertFalse(viewsheds.get(far).needs_update)
+